@@ -0,0 +1,84 @@
+from PIL import Image, ImageFont
+import os
+import threading
+from io import BytesIO
+from cache import LRUCache
+from metrics import metrics
+
+LOGO_PATH = os.path.join('assets', 'logo.png')
+FONT_PATH = os.path.join('assets', 'font.ttf')
+
+LOGO_CACHE_SIZE = int(os.environ.get("LOGO_CACHE_SIZE", 16))
+FONT_CACHE_SIZE = int(os.environ.get("FONT_CACHE_SIZE", 32))
+
+
+class AssetRegistry:
+    """Process-wide cache of decoded logos and loaded fonts.
+
+    Every entry is keyed by the file's mtime, so replacing a file on disk
+    makes the next lookup reload it while stale entries age out of the LRU.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources = {}  # path -> (mtime, decoded logo or raw font bytes)
+        self.logos = LRUCache(LOGO_CACHE_SIZE)
+        self.fonts = LRUCache(FONT_CACHE_SIZE)
+
+    def _mtime(self, path, label):
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            raise FileNotFoundError(f"{label} file not found at {path}")
+
+    def _source(self, path, mtime, loader):
+        with self._lock:
+            cached = self._sources.get(path)
+            if cached and cached[0] == mtime:
+                return cached[1]
+        data = loader(path)
+        with self._lock:
+            self._sources[path] = (mtime, data)
+        return data
+
+    @staticmethod
+    def _load_logo(path):
+        logo = Image.open(path)
+        logo.load()
+        return logo
+
+    @staticmethod
+    def _load_font_bytes(path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def get_logo(self, width, path=LOGO_PATH):
+        """Return the logo resized to the given width, keeping its aspect ratio"""
+        mtime = self._mtime(path, "Logo")
+
+        def build():
+            logo = self._source(path, mtime, self._load_logo)
+            height = int(logo.height * (width / logo.width))
+            return logo.resize((width, height))
+
+        return self.logos.get_or_create((path, mtime, width), build)
+
+    def get_font(self, size, path=FONT_PATH):
+        """Return a FreeTypeFont of the given size"""
+        mtime = self._mtime(path, "Font")
+
+        def build():
+            data = self._source(path, mtime, self._load_font_bytes)
+            return ImageFont.truetype(BytesIO(data), size)
+
+        return self.fonts.get_or_create((path, mtime, size), build)
+
+    def version(self, *paths):
+        """Current mtimes of the given asset files, for cache keys"""
+        paths = paths or (LOGO_PATH, FONT_PATH)
+        return tuple(self._mtime(path, "Asset") for path in paths)
+
+
+assets = AssetRegistry()
+metrics.register_cache('logos', assets.logos)
+metrics.register_cache('fonts', assets.fonts)
\ No newline at end of file
@@ -0,0 +1,231 @@
+"""Rendering micro-benchmarks.
+
+Renders synthetic posters at typical sizes through ImageProcessor and
+TemplateGenerator and reports per-stage timings, peak memory and throughput
+as JSON. Pass --baseline to compare against an earlier run and flag regressions.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --baseline bench.json --threshold 0.15
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from io import BytesIO
+
+import PIL
+import psutil
+from PIL import Image
+
+from encoder import Encoder, PROFILES
+from image_processor import ImageProcessor
+from session_store import MemorySessionStore
+from template_generator.generator import TemplateGenerator
+
+SIZES = {
+    'thumb': (500, 750),
+    '1080p': (1920, 1080),
+    'poster': (2000, 3000),
+    '4k': (3840, 2160),
+}
+
+OPERATIONS = ['watermark', 'template_movie', 'template_series', 'generate']
+
+BENCH_USER = 0
+
+
+def synthetic_jpeg(size):
+    """A noisy, gradient-filled JPEG so decode and encode cost is realistic"""
+    noise = Image.effect_noise(size, 40)
+    horizontal = Image.linear_gradient('L').resize(size)
+    radial = Image.radial_gradient('L').resize(size)
+    img = Image.merge('RGB', (noise, horizontal, radial))
+    buffer = BytesIO()
+    img.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+class PeakMemory:
+    """Samples process RSS in the background to catch the peak during a block"""
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.start = self.process.memory_info().rss
+        self.peak = self.start
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+    @property
+    def delta(self):
+        return self.peak - self.start
+
+
+def render_once(processor, generator, encoder, operation, data, stages):
+    """Run one full decode → render → encode cycle, recording stage timings"""
+    def record(stage, seconds):
+        stages[stage] += seconds
+
+    processor.on_stage = record
+    generator.on_stage = record
+    encoder.on_stage = record
+
+    if operation == 'watermark':
+        img = processor.add_watermark(data)
+    elif operation.startswith('template_'):
+        img = processor.apply_template(data, operation.split('_', 1)[1])
+    elif operation == 'generate':
+        img = generator.generate_template('1', BENCH_USER, data)[0]
+    else:
+        raise ValueError(f"Unknown operation: {operation}")
+
+    return encoder.encode_with_stats(img)[1]
+
+
+def run_case(operation, size, data, iterations, profile):
+    processor = ImageProcessor()
+    encoder = Encoder(profile)
+    generator = TemplateGenerator(MemorySessionStore('templates', ttl=None))
+    generator.current_state.set(BENCH_USER, {
+        'step': 'template',
+        'title': 'Benchmark Movie',
+        'genres': 'Action, Adventure',
+        'quality': '4K HDR',
+        'link': 'https://example.com',
+    })
+
+    totals = []
+    stage_runs = []
+    with PeakMemory() as memory:
+        for _ in range(iterations):
+            stages = defaultdict(float)
+            started = time.perf_counter()
+            encoded = render_once(processor, generator, encoder, operation, data, stages)
+            totals.append(time.perf_counter() - started)
+            stage_runs.append(stages)
+
+    # The first run pays for cold caches (fonts, logo, gradients, sprites)
+    warm = totals[1:] or totals
+    warm_stages = stage_runs[1:] or stage_runs
+    median = statistics.median(warm)
+    megapixels = size[0] * size[1] / 1e6
+    return {
+        'operation': operation,
+        'size': list(size),
+        'iterations': iterations,
+        'cold_seconds': totals[0],
+        'median_seconds': median,
+        'min_seconds': min(warm),
+        'stages': {
+            stage: statistics.median(run.get(stage, 0.0) for run in warm_stages)
+            for stage in sorted(set().union(*warm_stages))
+        },
+        'peak_rss_delta_bytes': memory.delta,
+        'images_per_second': 1 / median if median else 0.0,
+        'megapixels_per_second': megapixels / median if median else 0.0,
+        'input_bytes': len(data),
+        'output_bytes': encoded['bytes'],
+        'encode_profile': profile,
+        'encode_quality': encoded['quality'],
+        'encode_passes': encoded['passes'],
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return cases whose median time grew by more than threshold vs the baseline"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base or not base.get('median_seconds'):
+            continue
+        ratio = result['median_seconds'] / base['median_seconds']
+        result['baseline_median_seconds'] = base['median_seconds']
+        result['change'] = ratio - 1
+        if ratio > 1 + threshold:
+            regressions.append((name, base['median_seconds'], result['median_seconds'], ratio - 1))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark poster rendering")
+    parser.add_argument('--sizes', default=','.join(SIZES), help=f"comma-separated subset of {', '.join(SIZES)}")
+    parser.add_argument('--operations', default=','.join(OPERATIONS), help=f"comma-separated subset of {', '.join(OPERATIONS)}")
+    parser.add_argument('--profile', default='default', choices=sorted(PROFILES), help="encoder profile for the encode stage")
+    parser.add_argument('--iterations', type=int, default=5, help="renders per case, the first is reported as cold")
+    parser.add_argument('--output', help="write results JSON to this file")
+    parser.add_argument('--baseline', help="results JSON from an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="allowed slowdown vs baseline (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    # Assets are resolved relative to the repo root, like the bot does
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    results = {}
+    for size_name in args.sizes.split(','):
+        size = SIZES[size_name]
+        data = synthetic_jpeg(size)
+        for operation in args.operations.split(','):
+            name = f"{operation}@{size_name}"
+            results[name] = result = run_case(operation, size, data, args.iterations, args.profile)
+            stages = ' '.join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in result['stages'].items())
+            print(
+                f"{name:<24} median {result['median_seconds'] * 1000:8.1f}ms  "
+                f"cold {result['cold_seconds'] * 1000:8.1f}ms  "
+                f"{result['megapixels_per_second']:6.1f} MP/s  "
+                f"peak +{result['peak_rss_delta_bytes'] / 2**20:.0f}MB  "
+                f"out {result['output_bytes'] / 1024:.0f}KB q{result['encode_quality']}  {stages}"
+            )
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'pillow': PIL.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'encode_profile': args.profile,
+        },
+        'results': results,
+    }
+
+    regressions = []
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        report['regressions'] = [name for name, *_ in regressions]
+        for name, before, after, change in regressions:
+            print(f"REGRESSION {name}: {before * 1000:.1f}ms -> {after * 1000:.1f}ms (+{change:.0%})")
+        if not regressions:
+            print("No regressions against baseline")
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
\ No newline at end of file
@@ -1,45 +1,109 @@
-from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, CallbackQueryHandler
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from PIL import Image, ImageDraw, ImageFont
-import os, tempfile, requests, json
-from image_processor import ImageProcessor
-import psutil, platform
-from datetime import datetime
+import time
+STARTED_AT = time.monotonic()  # taken before the imports below, for the startup report
+
+from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, CallbackQueryHandler, TypeHandler
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
+import os, json
+from image_processor import ImageProcessor, open_image
+from encoder import Encoder
+from fetcher import ImageFetcher
+from poster_cache import PosterCache, POSTER_SIZES, TMDB_BRAND_SIZE, TMDB_IMAGE_URL
+import platform
 from template_generator.generator import TemplateGenerator
+from render_queue import RenderQueue, QueueFull
+from job_queue import open_job_queue
+from tmdb_client import TmdbClient
+from result_cache import ResultCache
+from speculative import SpeculativeRenderer
+from source_cache import SourceCache
+from session_store import open_session_store, photo_ref, as_photo, PHOTO_SESSION_TTL
 from telegram.error import NetworkError, Unauthorized, BadRequest
-import time
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics
+from server import HealthServer
+from send_scheduler import SendScheduler, ScheduledBot, SEND_WORKERS
+from telegram.utils.request import Request
+from startup import StartupTimer, prewarm
+from webhook import BOT_MODE, WEBHOOK_URL, WEBHOOK_MAX_CONNECTIONS, WebhookReceiver, webhook_path
+import threading
+import signal
 
 OWNER_IDS = [7202314047, 1826754085]
 AUTHORIZED_CHATS = [-1002385279104]
+ALBUM_WORKERS = int(os.environ.get("ALBUM_WORKERS", 4))
+MEDIA_GROUP_LIMIT = 10  # Bot API maximum photos per send_media_group
+UPDATE_WORKERS = int(os.environ.get("UPDATE_WORKERS", 4))  # dispatcher threads for run_async handlers
+HTTP_PORT = int(os.environ.get("PORT", 8080))
+ALLOWED_UPDATES = ['message', 'callback_query']
 
 class PosterBot:
-    def __init__(self):
+    def __init__(self, started_at=None):
+        self.startup = StartupTimer(started_at or time.monotonic())
+        self.startup.mark('imports')
         self.token = os.environ.get("BOT_TOKEN", "YOUR_BOT_TOKEN")
         self.tmdb_api_key = os.environ.get("TMDB_API_KEY", "YOUR_TMDB_API_KEY")
-        self.updater = Updater(self.token, use_context=True)
+        self.tmdb = TmdbClient(self.tmdb_api_key)
+        # Every outgoing send is rate limited to stay under Telegram's flood limits
+        self.send_scheduler = SendScheduler()
+        request = Request(con_pool_size=UPDATE_WORKERS + SEND_WORKERS + 4)
+        self.updater = Updater(
+            bot=ScheduledBot(self.token, self.send_scheduler, request=request),
+            use_context=True,
+            workers=UPDATE_WORKERS
+        )
         self.dp = self.updater.dispatcher
         self.image_processor = ImageProcessor()
-        self.user_states = {}
+        self.encoder = Encoder()
+        self.fetcher = ImageFetcher()
+        self.posters = PosterCache(self.fetcher)
+        self.render_queue = RenderQueue()
+        # With RENDER_BACKEND=sqlite renders go to render_worker.py processes instead
+        self.job_queue = open_job_queue()
+        self.speculator = SpeculativeRenderer(self.encode, busy=lambda: self.render_queue.depth > 0)
+        self.result_cache = ResultCache()
+        self.source_cache = SourceCache()
+        self.album_pool = ThreadPoolExecutor(max_workers=ALBUM_WORKERS)
+        self.user_states = open_session_store('photos', PHOTO_SESSION_TTL)
         self.template_generator = TemplateGenerator()
+        self.http_server = None
         self.max_retries = 5
         self.retry_delay = 5  # seconds
         
+        # Export render stage timings and queue state
+        self.image_processor.on_stage = metrics.stage_observer()
+        self.template_generator.on_stage = metrics.stage_observer()
+        self.encoder.on_stage = metrics.stage_observer()
+        metrics.gauge('render_queue_depth', lambda: self.render_queue.depth, "Render jobs waiting for a worker")
+        metrics.gauge('render_queue_running', lambda: self.render_queue.stats()['running'], "Render jobs running")
+        if self.job_queue:
+            metrics.gauge('job_queue_depth', lambda: self.job_queue.depth, "Render jobs waiting for a worker process")
+        metrics.gauge('outbound_send_queue_depth', lambda: self.send_scheduler.depth, "Sends waiting for rate limit tokens")
+        
         # Setup handlers
         self._setup_handlers()
+        self.startup.mark('init')
+        
+        # Fill the render caches in the background while waiting for the first update
+        if not self.job_queue:
+            prewarm(self.template_generator.templates)
         
     def _setup_handlers(self):
         """Setup all command handlers"""
-        self.dp.add_handler(CommandHandler("start", self.start))
-        self.dp.add_handler(CommandHandler("stats", self.stats))
-        self.dp.add_handler(CommandHandler("tm", self.search_movie))
-        self.dp.add_handler(CommandHandler("tt", self.search_tv))
-        self.dp.add_handler(CommandHandler("i", self.process_last_image))
-        self.dp.add_handler(CommandHandler("itemp", self.process_last_image_template))
-        self.dp.add_handler(CommandHandler("t", self.start_template))
-        self.dp.add_handler(MessageHandler(Filters.photo, self.save_image))
-        self.dp.add_handler(MessageHandler(Filters.text & ~Filters.command, self.process_image_url))
-        self.dp.add_handler(CallbackQueryHandler(self.handle_template_callback))
-        self.dp.add_handler(MessageHandler(Filters.text & ~Filters.command, self.handle_message))
+        track = self.tracked
+        self.dp.add_handler(TypeHandler(Update, self.startup.first_update), group=-1)
+        self.dp.add_handler(CommandHandler("start", track(self.start)))
+        self.dp.add_handler(CommandHandler("stats", track(self.stats)))
+        # TMDB lookups block on HTTP, so run them off the dispatcher thread
+        self.dp.add_handler(CommandHandler("tm", track(self.search_movie), run_async=True))
+        self.dp.add_handler(CommandHandler("tt", track(self.search_tv), run_async=True))
+        self.dp.add_handler(CommandHandler("i", track(self.process_last_image)))
+        self.dp.add_handler(CommandHandler("itemp", track(self.process_last_image_template)))
+        self.dp.add_handler(CommandHandler("t", track(self.start_template)))
+        self.dp.add_handler(MessageHandler(Filters.photo, track(self.save_image)))
+        self.dp.add_handler(MessageHandler(Filters.text & ~Filters.command, track(self.handle_message)))
+        self.dp.add_handler(CallbackQueryHandler(track(self.handle_template_callback), pattern=r'^template_[A-Za-z0-9-]+_\d+$'))
+        self.dp.add_handler(CallbackQueryHandler(track(self.button_callback), run_async=True))
         
         # Update start message
         self.start_message = (
@@ -53,14 +117,60 @@ class PosterBot:
             "/stats - সার্ভার স্ট্যাটস দেখুন"
         )
 
+    def tracked(self, handler):
+        """Wrap a handler so its calls, errors and latency show up in the metrics"""
+        @functools.wraps(handler)
+        def wrapper(update, context):
+            with metrics.track(handler.__name__):
+                return handler(update, context)
+        return wrapper
+
     def start(self, update, context):
         update.message.reply_text(self.start_message)
 
     def stats(self, update, context):
+        # Only needed here, so it isn't imported at startup
+        import psutil
         cpu = psutil.cpu_percent()
         memory = psutil.virtual_memory().percent
         disk = psutil.disk_usage('/').percent
-        uptime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        uptime = int(time.time() - metrics.started_at)
+        queue_stats = self.render_queue.stats()
+        
+        # Busiest handlers with their error counts and mean latency
+        latencies = metrics.histogram_summary('bot_handler_latency_seconds')
+        handlers = sorted(latencies.items(), key=lambda item: -item[1][0])[:5]
+        handler_lines = "\n".join(
+            f"  {dict(key)['handler']}: {count} ({metrics.counter_total('bot_handler_errors_total', dict(key))} err), {mean * 1000:.0f}ms"
+            for key, (count, mean) in handlers
+        ) or "  -"
+        
+        stages = metrics.histogram_summary('render_stage_seconds')
+        stage_line = ", ".join(f"{dict(key)['stage']} {mean * 1000:.0f}ms" for key, (count, mean) in sorted(stages.items())) or "-"
+        
+        tmdb = metrics.histogram_summary('tmdb_request_seconds')
+        tmdb_calls = sum(count for count, _ in tmdb.values())
+        tmdb_mean = sum(count * mean for count, mean in tmdb.values()) / tmdb_calls if tmdb_calls else 0.0
+        
+        sends = metrics.histogram_summary('outbound_send_wait_seconds')
+        send_count = sum(count for count, _ in sends.values())
+        send_wait = sum(count * mean for count, mean in sends.values()) / send_count if send_count else 0.0
+        flood_waits = metrics.counter_total('outbound_retry_after_total')
+        
+        encoded = metrics.histogram_summary('encode_output_bytes')
+        encode_line = ", ".join(f"{dict(key)['profile']} {count} x {mean / 1024:.0f}KB" for key, (count, mean) in sorted(encoded.items())) or "-"
+        
+        caches = metrics.to_json()['gauges'].get('cache_hit_ratio', {})
+        cache_line = ", ".join(f"{name.split('=', 1)[1]} {ratio:.0%}" for name, ratio in sorted(caches.items())) or "-"
+        
+        job_line = ""
+        if self.job_queue:
+            jobs = self.job_queue.stats()
+            job_line = (
+                f"Job queue: {jobs['queued']} waiting, {jobs['running']} running on {jobs['busy_workers']} workers\n"
+                f"Jobs: {jobs['done']} done, {jobs['failed']} failed, wait avg {jobs['avg_wait']:.2f}s, "
+                f"render avg {jobs['avg_run']:.2f}s\n"
+            )
         
         stats_text = (
             f"🖥 সার্ভার সট্যাটস:\n\n"
@@ -68,7 +178,18 @@ class PosterBot:
             f"Memory: {memory}%\n"
             f"Disk: {disk}%\n"
             f"OS: {platform.system()}\n"
-            f"Uptime: {uptime}"
+            f"Uptime: {uptime // 86400}d {uptime % 86400 // 3600}h {uptime % 3600 // 60}m\n\n"
+            f"Render queue: {queue_stats['running']} running, {queue_stats['waiting']} waiting\n"
+            f"Jobs: {queue_stats['completed']} done, {queue_stats['failed']} failed, {queue_stats['rejected']} rejected\n"
+            f"Wait: avg {queue_stats['avg_wait']:.2f}s, max {queue_stats['max_wait']:.2f}s\n"
+            f"Render: avg {queue_stats['avg_run']:.2f}s, max {queue_stats['max_run']:.2f}s\n"
+            f"{job_line}"
+            f"Stages: {stage_line}\n"
+            f"Encoded: {encode_line}\n"
+            f"Sends: {send_count}, avg wait {send_wait * 1000:.0f}ms, {self.send_scheduler.depth} queued, {flood_waits} flood waits\n"
+            f"TMDB: {tmdb_calls} calls, avg {tmdb_mean * 1000:.0f}ms\n"
+            f"Cache hits: {cache_line}\n\n"
+            f"Handlers:\n{handler_lines}"
         )
         update.message.reply_text(stats_text)
 
@@ -79,16 +200,37 @@ class PosterBot:
         
         # Only allow in private chat with sudo users
         if update.effective_chat.type == 'private' and user_id in OWNER_IDS:
-            photo = update.message.photo[-1]
-            self.user_states[user_id] = {
+            photo = photo_ref(update.message.photo[-1])
+            media_group_id = update.message.media_group_id
+            previous = self.user_states.get(user_id) or {}
+            
+            # Start downloading and decoding now so /i and /itemp can render straight away
+            if not self.job_queue:
+                self.source_cache.prefetch(context.bot, as_photo(photo))
+            
+            # Photos sent as an album share a media_group_id, collect them together
+            if media_group_id and previous.get('media_group_id') == media_group_id:
+                previous['album'].append(photo)
+                previous['last_photo'] = photo
+                self.user_states.set(user_id, previous)
+                return
+            
+            # The previous photo(s) won't be rendered now, stop prefetching them
+            for old in previous.get('album', []):
+                if old['file_unique_id'] != photo['file_unique_id']:
+                    self.source_cache.cancel(old['file_unique_id'])
+            
+            self.user_states.set(user_id, {
                 'last_photo': photo,
-                'message_id': update.message.message_id
-            }
+                'message_id': update.message.message_id,
+                'media_group_id': media_group_id,
+                'album': [photo]
+            })
             
             # Check if user is in template generation process
-            if hasattr(self.template_generator, 'current_state') and user_id in self.template_generator.current_state:
+            state = self.template_generator.current_state.get(user_id)
+            if state:
                 # Continue with template generation
-                state = self.template_generator.current_state[user_id]
                 if state['step'] == 'title':
                     update.message.reply_text("টাইটেল লিখুন 🎬")
             else:
@@ -97,35 +239,104 @@ class PosterBot:
                     "ছবি সেভ করা হয়েছে। এডিট করতে /i অথবা টেমপ্লেট ব্যবহার করতে /itemp কমান্ড ব্যবহার করুন।"
                 )
 
+    def load_photo(self, bot, photo):
+        """Decode a Telegram photo, downloading it only if it isn't cached yet"""
+        return self.source_cache.get_image(bot, photo)
+
+    def encode(self, img, name='poster'):
+        """Encode a rendered image for upload with the deployment's encode profile"""
+        return self.encoder.encode(img, name)
+
+    def render_job(self, message, render, photos=None, url=None, **extra):
+        """Describe a render for a worker process, replying the way message.reply_* would"""
+        job = {
+            'chat_id': message.chat_id,
+            'reply_to': message.message_id if message.chat.type != 'private' else None,
+            'render': render,
+        }
+        if url:
+            job['url'] = url
+        elif photos is not None:
+            job['photos'] = photos
+        job.update(extra)
+        return job
+
+    def enqueue_render(self, message, name, fn, *args, job=None):
+        """Hand a render job to the render queue, telling the user if they have to wait.
+
+        When worker processes render (RENDER_BACKEND=sqlite) the job description is
+        queued for them instead of fn.
+        """
+        try:
+            if self.job_queue and job is not None:
+                _, position = self.job_queue.enqueue(name, job)
+            else:
+                position = self.render_queue.submit(name, fn, *args)
+        except QueueFull:
+            message.reply_text("সার্ভার এখন ব্যস্ত, কিছুক্ষণ পর আবার চেষ্টা করুন।")
+            return False
+        
+        if position:
+            message.reply_text(f"আপনার কাজ সারিতে আছে, অবস্থান {position} ⏳")
+        return True
+
+    def send_rendered(self, message, cache_key, render, owner=None, **kwargs):
+        """Reply with an already-uploaded result if there is one, otherwise render, send and remember it.
+
+        With owner set, a speculative render of the same request is used if one is ready.
+        """
+        buffer = self.speculator.claim(owner, cache_key) if owner is not None else None
+        file_id = self.result_cache.get(cache_key)
+        if file_id:
+            try:
+                return message.reply_photo(file_id, **kwargs)
+            except BadRequest:
+                # Telegram no longer knows the file, render it again
+                self.result_cache.discard(cache_key)
+        
+        sent = message.reply_photo(buffer or self.encode(render()), **kwargs)
+        self.result_cache.put(cache_key, sent.photo[-1].file_id)
+        return sent
+
     def process_image(self, update, context, photo):
         try:
-            # Download the photo
-            file = context.bot.get_file(photo.file_id)
-            
-            # Create temp directory if it doesn't exist
-            if not os.path.exists('temp'):
-                os.makedirs('temp')
-            
-            # Download and save the image
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg', dir='temp')
-            file.download(temp_file.name)
-            
-            # Process the image
-            processed_img = self.image_processor.add_watermark(temp_file.name)
-            output_path = temp_file.name.replace('.jpg', '_processed.jpg')
-            processed_img.save(output_path)
-            
-            # Send the processed image
-            with open(output_path, 'rb') as photo_file:
-                update.message.reply_photo(photo_file)
-            
-            # Cleanup
-            os.unlink(temp_file.name)
-            os.unlink(output_path)
+            # Download, process and send the image without touching disk
+            cache_key = self.result_cache.key(photo.file_unique_id, 'watermark')
+            self.send_rendered(
+                update.message,
+                cache_key,
+                lambda: self.image_processor.add_watermark(self.load_photo(context.bot, photo))
+            )
             
         except Exception as e:
+            metrics.error()
             update.message.reply_text(f"ছবি প্রসেস করতে সমস্যা হয়েছে: {str(e)}")
 
+    def process_album(self, message, context, photos, render):
+        """Render every photo of an album in parallel and send them back as one album"""
+        try:
+            started = time.monotonic()
+            images = list(self.album_pool.map(lambda photo: render(self.load_photo(context.bot, photo)), photos))
+            rendered = time.monotonic()
+            
+            for i in range(0, len(images), MEDIA_GROUP_LIMIT):
+                media = [
+                    InputMediaPhoto(self.encode(img, name=f'poster_{i + n}'))
+                    for n, img in enumerate(images[i:i + MEDIA_GROUP_LIMIT])
+                ]
+                message.reply_media_group(media)
+            finished = time.monotonic()
+            
+            print(f"Album of {len(images)}: render {rendered - started:.2f}s, upload {finished - rendered:.2f}s")
+            message.reply_text(
+                f"✅ {len(images)} টি ছবি প্রসেস হয়েছে\n"
+                f"রেন্ডার: {rendered - started:.1f}s, আপলোড: {finished - rendered:.1f}s"
+            )
+            
+        except Exception as e:
+            metrics.error()
+            message.reply_text(f"অ্যালবাম প্রসেস করতে সমস্যা হয়েছে: {str(e)}")
+
     def process_last_image(self, update, context):
         # Check if admin/owner
         if not self.is_admin_or_owner(update):
@@ -133,36 +344,47 @@ class PosterBot:
             return
             
         user_id = update.message.from_user.id
-        if user_id not in self.user_states:
+        state = self.user_states.get(user_id)
+        if not state:
             update.message.reply_text("দয়া করে আগে একটি ছবি পাঠান।")
             return
         
         try:
-            photo = self.user_states[user_id]['last_photo']
-            self.process_image(update, context, photo)
+            if len(state.get('album', [])) > 1:
+                self.enqueue_render(
+                    update.message, 'album_watermark', self.process_album,
+                    update.message, context, [as_photo(p) for p in state['album']], self.image_processor.add_watermark,
+                    job=self.render_job(update.message, {'op': 'watermark'}, photos=state['album'])
+                )
+                return
+            
+            photo = as_photo(state['last_photo'])
+            self.enqueue_render(
+                update.message, 'watermark', self.process_image, update, context, photo,
+                job=self.render_job(update.message, {'op': 'watermark'}, photos=[state['last_photo']])
+            )
         except Exception as e:
+            metrics.error()
             update.message.reply_text(f"দুঃখিত! একটি সমস্যা হয়েছে: {str(e)}")
 
     def process_image_url(self, update, context):
         text = update.message.text
         if text.startswith(('http://', 'https://')) and any(ext in text.lower() for ext in ['.jpg', '.jpeg', '.png']):
-            try:
-                response = requests.get(text)
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-                temp_file.write(response.content)
-                temp_file.close()
-                
-                processed_img = self.image_processor.add_watermark(temp_file.name)
-                output_path = temp_file.name.replace('.jpg', '_processed.jpg')
-                processed_img.save(output_path)
-                
-                with open(output_path, 'rb') as photo_file:
-                    update.message.reply_photo(photo_file)
-                
-                os.unlink(temp_file.name)
-                os.unlink(output_path)
-            except Exception as e:
-                update.message.reply_text(f"ছবি প্রসেস করতে সমস্যা হয়েছে: {str(e)}")
+            self.enqueue_render(
+                update.message, 'url', self.process_url, update, text,
+                job=self.render_job(update.message, {'op': 'watermark'}, url=text)
+            )
+
+    def process_url(self, update, url):
+        try:
+            # Downloaded with a size cap and decoded at no more than the size we render
+            with metrics.timer('render_stage_seconds', {'stage': 'fetch'}):
+                image = self.fetcher.fetch_image(url)
+            processed_img = self.image_processor.add_watermark(image)
+            update.message.reply_photo(self.encode(processed_img))
+        except Exception as e:
+            metrics.error()
+            update.message.reply_text(f"ছবি প্রসেস করতে সমস্যা হয়েছে: {str(e)}")
 
     def search_movie(self, update, context):
         if not self.is_authorized(update):
@@ -174,17 +396,8 @@ class PosterBot:
             update.message.reply_text("দয়া করে একটি মুভির নাম লিখুন।")
             return
         
-        url = f"https://api.themoviedb.org/3/search/movie"
-        params = {
-            'api_key': self.tmdb_api_key,
-            'query': query,
-            'language': 'en-US',
-            'page': 1
-        }
-        
         try:
-            response = requests.get(url, params=params)
-            results = response.json()['results'][:5]
+            results = self.tmdb.search_movie(query)['results'][:5]
             
             if not results:
                 update.message.reply_text("কোন মুভি পাওয়া যায়নি।")
@@ -201,6 +414,7 @@ class PosterBot:
             update.message.reply_text("নিচের মুভিগুলো থেকে একটি সিলেক্ট করুন:", reply_markup=reply_markup)
         
         except Exception as e:
+            metrics.error()
             update.message.reply_text(f"সার্চ করতে সমস্যা হয়েছে: {str(e)}")
 
     def button_callback(self, update, context):
@@ -211,44 +425,32 @@ class PosterBot:
             template_type = data.split('_')[1]
             user_id = query.from_user.id
             
-            if user_id not in self.user_states:
+            state = self.user_states.get(user_id)
+            if not state:
                 query.message.reply_text("দয়া করে আগে একটি ছবি পাঠান।")
                 return
             
-            try:
-                photo = self.user_states[user_id]['last_photo']
-                file = context.bot.get_file(photo.file_id)
-                
-                # Create temp directory if it doesn't exist
-                if not os.path.exists('temp'):
-                    os.makedirs('temp')
-                
-                # Download and save the image
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg', dir='temp')
-                file.download(temp_file.name)
-                
-                # Process the image with selected template
-                processed_img = self.image_processor.apply_template(temp_file.name, template_type)
-                output_path = temp_file.name.replace('.jpg', '_processed.jpg')
-                processed_img.save(output_path)
-                
-                # Send the processed image
-                with open(output_path, 'rb') as photo_file:
-                    query.message.reply_photo(photo_file)
-                
-                # Cleanup
-                os.unlink(temp_file.name)
-                os.unlink(output_path)
-                
-                # Delete the template selection message
-                query.message.delete()
-                
-            except Exception as e:
-                query.message.reply_text(f"টেমপ্লেট প্রসেস করতে সমস্যা হয়েছে: {str(e)}")
-            
-            finally:
-                query.answer()
+            if len(state.get('album', [])) > 1:
+                render = lambda img: self.image_processor.apply_template(img, template_type)
+                self.enqueue_render(
+                    query.message, f'album_template_{template_type}', self.process_album,
+                    query.message, context, [as_photo(p) for p in state['album']], render,
+                    job=self.render_job(query.message, {'op': 'template', 'template': template_type}, photos=state['album'])
+                )
+            else:
+                photo = as_photo(state['last_photo'])
+                job = self.render_job(
+                    query.message, {'op': 'template', 'template': template_type}, photos=[state['last_photo']],
+                    delete_message_id=query.message.message_id
+                )
+                self.enqueue_render(
+                    query.message, f'template_{template_type}', self.process_template, query, context, photo, template_type,
+                    job=job
+                )
+            query.answer()
             
+        elif data.startswith('brand_'):
+            self.brand_poster(update, query)
         elif data.startswith('movie_'):
             movie_id = data.split('_')[1]
             self.show_movie_details(query, movie_id)
@@ -256,16 +458,83 @@ class PosterBot:
             tv_id = data.split('_')[1]
             self.show_tv_details(query, tv_id)
 
+    def process_template(self, query, context, photo, template_type):
+        try:
+            # Process the image with selected template and send it
+            cache_key = self.result_cache.key(photo.file_unique_id, 'template', template_type)
+            self.send_rendered(
+                query.message,
+                cache_key,
+                self.template_render(context.bot, photo, template_type),
+                owner=query.from_user.id
+            )
+            
+            # Delete the template selection message
+            query.message.delete()
+            
+        except Exception as e:
+            metrics.error()
+            query.message.reply_text(f"টেমপ্লেট প্রসেস করতে সমস্যা হয়েছে: {str(e)}")
+
+    def template_render(self, bot, photo, template_type):
+        return lambda: self.image_processor.apply_template(self.load_photo(bot, photo), template_type)
+
+    def generated_render(self, bot, photo, template_num, user_id):
+        def render():
+            image = self.load_photo(bot, photo)
+            result = self.template_generator.generate_template(template_num, user_id, image)
+            if not result:
+                raise Exception("Template rendering failed")
+            return result[0]
+        return render
+
+    def generated_key(self, photo, template_num, state):
+        return self.result_cache.key(
+            photo.file_unique_id, 'generate', template_num,
+            (state['title'], state['genres'], state['quality'], self.template_generator.template_version(template_num))
+        )
+
+    @staticmethod
+    def offered_choices(reply_markup):
+        """callback_data of every button on an inline keyboard"""
+        return [button.callback_data for row in reply_markup.inline_keyboard for button in row if button.callback_data]
+
+    def speculate_templates(self, bot, user_id, reply_markup):
+        """Render every template offered on a /itemp keyboard while the user picks one"""
+        if self.job_queue:
+            return
+        state = self.user_states.get(user_id)
+        if not state or len(state.get('album', [])) > 1:
+            return
+        photo = as_photo(state['last_photo'])
+        renders = {}
+        for data in self.offered_choices(reply_markup):
+            template_type = data.split('_')[1]
+            key = self.result_cache.key(photo.file_unique_id, 'template', template_type)
+            if key not in self.result_cache:
+                renders[key] = self.template_render(bot, photo, template_type)
+        self.speculator.start(user_id, renders)
+
+    def speculate_generated(self, bot, user_id, reply_markup):
+        """Render every template offered at the end of /t while the user picks one"""
+        if self.job_queue:
+            return
+        state = self.user_states.get(user_id)
+        template_state = self.template_generator.current_state.get(user_id)
+        if not state or not template_state:
+            return
+        photo = as_photo(state['last_photo'])
+        renders = {}
+        for data in self.offered_choices(reply_markup):
+            template_num = data.split('_')[1]
+            key = self.generated_key(photo, template_num, template_state)
+            if key not in self.result_cache:
+                renders[key] = self.generated_render(bot, photo, template_num, user_id)
+        self.speculator.start(user_id, renders)
+
     def show_movie_details(self, query, movie_id):
-        url = f"https://api.themoviedb.org/3/movie/{movie_id}"
-        params = {
-            'api_key': self.tmdb_api_key,
-            'language': 'en-US'
-        }
-        
         try:
-            response = requests.get(url, params=params)
-            movie = response.json()
+            movie = self.tmdb.movie_details(movie_id)
             
             details = (
                 f"🎬 {movie['title']}\n\n"
@@ -277,14 +546,75 @@ class PosterBot:
             )
             
             if movie.get('poster_path'):
-                poster_url = f"https://image.tmdb.org/t/p/w500{movie['poster_path']}"
-                query.message.reply_photo(poster_url, caption=details)
+                poster_url = f"{TMDB_IMAGE_URL}/w500{movie['poster_path']}"
+                query.message.reply_photo(poster_url, caption=details, reply_markup=self.brand_keyboard('movie', movie_id))
             else:
                 query.message.reply_text(details)
             
         except Exception as e:
+            metrics.error()
             query.message.reply_text(f"বিস্তারিত দেখাতে সমস্যা হয়েছে: {str(e)}")
 
+    @staticmethod
+    def brand_keyboard(kind, item_id):
+        """Buttons under TMDB details that brand the poster without re-uploading it"""
+        keyboard = [
+            [
+                InlineKeyboardButton(f"🖼 লোগো {size}", callback_data=f"brand_{kind}_{item_id}_watermark_{size}")
+                for size in POSTER_SIZES
+            ],
+            [
+                InlineKeyboardButton("🎬 মুভি", callback_data=f"brand_{kind}_{item_id}_movie_{TMDB_BRAND_SIZE}"),
+                InlineKeyboardButton("📺 সিরিজ", callback_data=f"brand_{kind}_{item_id}_series_{TMDB_BRAND_SIZE}"),
+                InlineKeyboardButton("✨ মিনিমাল", callback_data=f"brand_{kind}_{item_id}_minimal_{TMDB_BRAND_SIZE}")
+            ]
+        ]
+        return InlineKeyboardMarkup(keyboard)
+
+    def brand_poster(self, update, query):
+        """Fetch a TMDB poster server-side and watermark or template it in one step"""
+        if not self.is_authorized(update):
+            query.answer("আপনি এই কমান্ড ব্যবহার করতে অনুমোদিত নন।")
+            return
+        
+        _, kind, item_id, operation, size = query.data.split('_')
+        try:
+            # Details are cached, so this is normally not a TMDB request
+            details = self.tmdb.movie_details(item_id) if kind == 'movie' else self.tmdb.tv_details(item_id)
+        except Exception as e:
+            metrics.error()
+            query.answer()
+            query.message.reply_text(f"পোস্টার ব্র্যান্ড করতে সমস্যা হয়েছে: {str(e)}")
+            return
+        poster_path = details.get('poster_path')
+        if not poster_path:
+            query.answer("পোস্টার পাওয়া যায়নি।")
+            return
+        
+        render = {'op': 'watermark'} if operation == 'watermark' else {'op': 'template', 'template': operation}
+        self.enqueue_render(
+            query.message, f'brand_{operation}', self.process_brand, query.message, poster_path, size, render,
+            job=self.render_job(query.message, render, poster={'path': poster_path, 'size': size})
+        )
+        query.answer()
+
+    def process_brand(self, message, poster_path, size, render):
+        try:
+            # TMDB posters never change under the same path, so their renders are cached like uploads
+            source = f"tmdb_{size}{poster_path}"
+            cache_key = self.result_cache.key(source, render['op'], render.get('template'))
+            self.send_rendered(message, cache_key, lambda: self.render_poster(poster_path, size, render))
+        except Exception as e:
+            metrics.error()
+            message.reply_text(f"পোস্টার ব্র্যান্ড করতে সমস্যা হয়েছে: {str(e)}")
+
+    def render_poster(self, poster_path, size, render):
+        with metrics.timer('render_stage_seconds', {'stage': 'fetch'}):
+            image = open_image(self.posters.get(poster_path, size), max_size=self.fetcher.max_size)
+        if render['op'] == 'watermark':
+            return self.image_processor.add_watermark(image)
+        return self.image_processor.apply_template(image, render['template'])
+
     def process_last_image_template(self, update, context):
         # Check if admin/owner
         if not self.is_admin_or_owner(update):
@@ -310,6 +640,7 @@ class PosterBot:
             "টেমপ্লেট সিলেক্ট করুন:",
             reply_markup=reply_markup
         )
+        self.speculate_templates(context.bot, user_id, reply_markup)
 
     def search_tv(self, update, context):
         if not self.is_authorized(update):
@@ -321,17 +652,8 @@ class PosterBot:
             update.message.reply_text("দয়া করে একটি টিভি সিরিজের নাম লিখুন।")
             return
         
-        url = f"https://api.themoviedb.org/3/search/tv"
-        params = {
-            'api_key': self.tmdb_api_key,
-            'query': query,
-            'language': 'en-US',
-            'page': 1
-        }
-        
         try:
-            response = requests.get(url, params=params)
-            results = response.json()['results'][:5]
+            results = self.tmdb.search_tv(query)['results'][:5]
             
             if not results:
                 update.message.reply_text("কোন টিভি সিরিজ পাওয়া যায়নি।")
@@ -346,18 +668,12 @@ class PosterBot:
             update.message.reply_text("নিচের সিরিজগুলো থেকে একটি সিলেক্ট করুন:", reply_markup=reply_markup)
         
         except Exception as e:
+            metrics.error()
             update.message.reply_text(f"সার্চ করে সমস্যা হয়েছে: {str(e)}")
 
     def show_tv_details(self, query, tv_id):
-        url = f"https://api.themoviedb.org/3/tv/{tv_id}"
-        params = {
-            'api_key': self.tmdb_api_key,
-            'language': 'en-US'
-        }
-        
         try:
-            response = requests.get(url, params=params)
-            show = response.json()
+            show = self.tmdb.tv_details(tv_id)
             
             details = (
                 f"📺 {show['name']}\n\n"
@@ -370,12 +686,13 @@ class PosterBot:
             )
             
             if show.get('poster_path'):
-                poster_url = f"https://image.tmdb.org/t/p/w500{show['poster_path']}"
-                query.message.reply_photo(poster_url, caption=details)
+                poster_url = f"{TMDB_IMAGE_URL}/w500{show['poster_path']}"
+                query.message.reply_photo(poster_url, caption=details, reply_markup=self.brand_keyboard('tv', tv_id))
             else:
                 query.message.reply_text(details)
             
         except Exception as e:
+            metrics.error()
             query.message.reply_text(f"বিস্তারিত দেখাতে সমস্যা হয়েছে: {str(e)}")
 
     def is_authorized(self, update):
@@ -429,39 +746,53 @@ class PosterBot:
                 query.answer("এই টেমপ্লেট আপনার জন্য নয়!")
                 return
                 
-            # Generate template
-            result = self.template_generator.generate_template(
-                template_num,
-                user_id,
-                self.user_states[user_id]['last_photo']
-            )
-            
-            if result:
-                img, button_text, link = result
-                
-                # Save temporary image
-                temp_path = f"temp/template_{user_id}.jpg"
-                img.save(temp_path)
+            state = self.user_states.get(user_id)
+            if not state:
+                query.answer()
+                query.message.reply_text("দয়া করে আগে একটি ছবি পাঠান।")
+                return
                 
+            photo = as_photo(state['last_photo'])
+            # Workers can't see this process's /t answers, so they travel with the job
+            job = None
+            template_state = self.template_generator.current_state.get(user_id)
+            if template_state:
+                button = self.template_generator.download_button(template_num, user_id, template_state)
+                job = self.render_job(
+                    query.message, {'op': 'generate', 'template': template_num, 'fields': template_state, 'button': list(button)},
+                    photos=[state['last_photo']], delete_message_id=query.message.message_id
+                )
+            queued = self.enqueue_render(
+                query.message, f'generate_{template_num}', self.generate_template, query, context, photo, template_num, user_id,
+                job=job
+            )
+            if queued and self.job_queue and job:
+                self.template_generator.current_state.delete(user_id)
+            query.answer()
+
+    def generate_template(self, query, context, photo, template_num, user_id):
+        """Render a /t template and send it with its download button"""
+        try:
+            state = self.template_generator.current_state.get(user_id)
+            if state:
                 # Create button
+                button_text, link = self.template_generator.download_button(template_num, user_id, state)
                 keyboard = [[InlineKeyboardButton(button_text, url=link)]]
                 reply_markup = InlineKeyboardMarkup(keyboard)
                 
                 # Send image with button
-                with open(temp_path, 'rb') as photo:
-                    query.message.reply_photo(
-                        photo,
-                        reply_markup=reply_markup
-                    )
-                    
-                # Cleanup
-                os.remove(temp_path)
-                
+                cache_key = self.generated_key(photo, template_num, state)
+                render = self.generated_render(context.bot, photo, template_num, user_id)
+                self.send_rendered(query.message, cache_key, render, owner=user_id, reply_markup=reply_markup)
+            
                 # Clear user state
-                del self.template_generator.current_state[user_id]
-                
-            query.answer()
+                self.template_generator.current_state.delete(user_id)
+            
             query.message.delete()
+            
+        except Exception as e:
+            metrics.error()
+            query.message.reply_text(f"টেমপ্লেট তৈরি করতে সমস্যা হয়েছে: {str(e)}")
 
     def handle_message(self, update, context):
         """Handle text messages"""
@@ -469,9 +800,10 @@ class PosterBot:
         text = update.message.text
         
         # Check if user is in template generation process
-        if hasattr(self.template_generator, 'current_state') and user_id in self.template_generator.current_state:
+        state = self.template_generator.current_state.get(user_id)
+        if state:
             print(f"Processing template step for user {user_id}")
-            print(f"Current state: {self.template_generator.current_state[user_id]}")
+            print(f"Current state: {state}")
             
             response = self.template_generator.process_step(user_id, text)
             print(f"Template generator response: {response}")
@@ -479,81 +811,136 @@ class PosterBot:
             if isinstance(response, tuple):
                 message, reply_markup = response
                 update.message.reply_text(message, reply_markup=reply_markup)
+                self.speculate_generated(context.bot, user_id, reply_markup)
             else:
                 update.message.reply_text(response)
+        else:
+            self.process_image_url(update, context)
+
+    def start_http_server(self):
+        """Start the health check and metrics server once per process"""
+        if self.http_server:
+            return
+        self.http_server = HealthServer(port=HTTP_PORT)
+        self.http_server.add_route('GET', '/metrics', lambda body: (200, 'text/plain; version=0.0.4', metrics.to_prometheus().encode()))
+        self.http_server.add_json_route('/metrics.json', metrics.to_json)
+        self.http_server.start()
+
+    def start_webhook(self):
+        """Receive updates on the HTTP server instead of polling getUpdates"""
+        if not WEBHOOK_URL:
+            raise ValueError("WEBHOOK_URL must be set when BOT_MODE=webhook")
+        path = webhook_path(self.token)
+        WebhookReceiver(self.updater.bot, self.updater.update_queue).register(self.http_server, path)
+        
+        # Updater.start_polling normally starts the dispatcher thread
+        if not self.dp.running:
+            ready = threading.Event()
+            threading.Thread(target=self.dp.start, kwargs={'ready': ready}, name='dispatcher', daemon=True).start()
+            ready.wait()
+        
+        self.updater.bot.set_webhook(
+            url=WEBHOOK_URL.rstrip('/') + path,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=ALLOWED_UPDATES,
+            drop_pending_updates=True
+        )
+
+    def wait_for_stop(self):
+        """Block while the dispatcher runs, until SIGINT, SIGTERM or SIGABRT like Updater.idle()"""
+        stop = threading.Event()
+
+        def handle_signal(signum, frame):
+            print(f"Received signal {signum}, stopping")
+            stop.set()
+
+        for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGABRT):
+            signal.signal(signum, handle_signal)
+        while self.dp.running and not stop.wait(1):
+            pass
+
+    def shutdown(self):
+        """Stop taking updates, let running handlers finish, then save and close the stores"""
+        # Webhook updates refused from here on are redelivered by Telegram after the restart
+        if self.http_server:
+            self.http_server.stop()
+        if self.updater.running:
+            self.updater.stop()
+        self.dp.stop()
+        self.tmdb.save_cache()
+        self.user_states.close()
+        self.template_generator.current_state.close()
+        if self.job_queue:
+            self.job_queue.close()
+        print("Bot stopped")
 
     def run(self):
         """Run the bot with retry mechanism"""
         retry_count = 0
-        while retry_count < self.max_retries:
-            try:
-                print(f"Starting bot (attempt {retry_count + 1})")
-                
-                # Configure updater with larger timeout and retry settings
-                self.updater.bot.get_updates(timeout=60, allowed_updates=['message', 'callback_query'])
-                
-                # Start polling with clean start
-                self.updater.start_polling(
-                    drop_pending_updates=True,
-                    bootstrap_retries=5,
-                    read_timeout=30,
-                    timeout=30,
-                    allowed_updates=['message', 'callback_query']
-                )
-                print("Bot is running...")
-
-                # Start health check server
-                def run_health_server():
-                    from http.server import HTTPServer, BaseHTTPRequestHandler
+        try:
+            while retry_count < self.max_retries:
+                try:
+                    print(f"Starting bot (attempt {retry_count + 1})")
+                    
+                    # Health check and metrics server, also serves the webhook
+                    self.start_http_server()
+                    self.startup.mark('http')
                     
-                    class HealthCheckHandler(BaseHTTPRequestHandler):
-                        def do_GET(self):
-                            self.send_response(200)
-                            self.send_header('Content-type', 'text/plain')
-                            self.end_headers()
-                            self.wfile.write(b"OK")
+                    if BOT_MODE == 'webhook':
+                        self.start_webhook()
+                        self.startup.mark('connect')
+                        self.startup.ready()
+                        print("Bot is running (webhook)...")
                         
-                        def log_message(self, format, *args):
-                            pass
-
-                    try:
-                        server = HTTPServer(('', 8080), HealthCheckHandler)
-                        print("Health check server running on port 8080")
-                        server.serve_forever()
-                    except Exception as e:
-                        print(f"Health server error: {e}")
-
-                import threading
-                health_thread = threading.Thread(target=run_health_server, daemon=True)
-                health_thread.start()
-
-                # Keep the main thread running
-                self.updater.idle()
-                break  # If we get here, bot is running successfully
-                
-            except NetworkError as e:
-                print(f"Network error: {e}")
-                retry_count += 1
-                if retry_count < self.max_retries:
-                    print(f"Retrying in {self.retry_delay} seconds...")
-                    time.sleep(self.retry_delay)
-                    continue
-                raise e
-                
-            except (Unauthorized, BadRequest) as e:
-                print(f"Fatal error: {e}")
-                raise e
-                
-            except Exception as e:
-                print(f"Unexpected error: {e}")
-                retry_count += 1
-                if retry_count < self.max_retries:
-                    print(f"Retrying in {self.retry_delay} seconds...")
-                    time.sleep(self.retry_delay)
-                    continue
-                raise e
+                        # Keep the main thread running until a stop signal
+                        self.wait_for_stop()
+                    else:
+                        # Start polling with clean start; bootstrapping happens on the polling thread
+                        self.updater.start_polling(
+                            drop_pending_updates=True,
+                            bootstrap_retries=5,
+                            read_latency=5,
+                            timeout=30,
+                            allowed_updates=ALLOWED_UPDATES
+                        )
+                        self.startup.mark('connect')
+                        self.startup.ready()
+                        print("Bot is running...")
+                        
+                        # Keep the main thread running
+                        self.updater.idle()
+                    break  # If we get here, bot is running successfully
+                    
+                except NetworkError as e:
+                    print(f"Network error: {e}")
+                    retry_count += 1
+                    if retry_count < self.max_retries:
+                        print(f"Retrying in {self.retry_delay} seconds...")
+                        time.sleep(self.retry_delay)
+                        self.startup.mark('retries')
+                        continue
+                    raise e
+                    
+                except (Unauthorized, BadRequest) as e:
+                    print(f"Fatal error: {e}")
+                    raise e
+                    
+                except Exception as e:
+                    print(f"Unexpected error: {e}")
+                    retry_count += 1
+                    if retry_count < self.max_retries:
+                        print(f"Retrying in {self.retry_delay} seconds...")
+                        time.sleep(self.retry_delay)
+                        self.startup.mark('retries')
+                        continue
+                    raise e
+        finally:
+            # Also on giving up, so the restarted bot can bind PORT again
+            self.shutdown()
+
 
 if __name__ == '__main__':
+    started_at = STARTED_AT
     while True:
         try:
             # Create necessary directories
@@ -561,8 +948,10 @@ if __name__ == '__main__':
             os.makedirs('temp', exist_ok=True)
             
             # Start bot
-            bot = PosterBot()
+            bot = PosterBot(started_at)
+            started_at = None
             bot.run()
+            break  # Stopped by a signal
             
         except Exception as e:
             print(f"Bot crashed: {e}")
@@ -0,0 +1,192 @@
+"""Offline bulk poster rendering.
+
+Renders every row of a CSV, JSONL or JSON manifest against the images in a
+directory and writes the results to an output directory, on all CPU cores
+and without any Telegram connection. Rows whose output file already exists
+are skipped, so an interrupted run is resumed by starting it again.
+
+    python bulk.py posters/ manifest.csv --output branded/
+    python bulk.py posters/ manifest.jsonl --output branded/ --processes 4 --profile quality
+
+Manifest columns: image, title, genres, quality, link, template and an
+optional output file name. template is "watermark" (the default), an /itemp
+template (movie, series, minimal) or a templates.json key, which is filled
+in from title, genres and quality. Every rendered row is appended to
+index.jsonl in the output directory together with its link.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from encoder import Encoder, EXTENSIONS, PROFILES
+from fetcher import MAX_INPUT_DIMENSION
+from image_processor import ImageProcessor, open_image
+from session_store import MemorySessionStore
+from template_generator.generator import TemplateGenerator
+from template_manager import TemplateManager
+
+LEGACY_TEMPLATES = ('movie', 'series', 'minimal')
+BULK_USER = 0
+
+# Per-process renderers, created once by the pool initializer
+_worker = {}
+
+
+def read_manifest(path):
+    """Rows of a CSV (with a header), JSONL or JSON array manifest as dicts"""
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if path.lower().endswith('.jsonl'):
+            rows = [json.loads(line) for line in f if line.strip()]
+        elif path.lower().endswith('.json'):
+            rows = json.load(f)
+            if not isinstance(rows, list):
+                raise ValueError("A .json manifest must be an array of rows")
+        else:
+            rows = list(csv.DictReader(f))
+    for number, row in enumerate(rows, 1):
+        if not isinstance(row, dict):
+            raise ValueError(f"Manifest row {number} is not an object")
+        if not row.get('image'):
+            raise ValueError(f"Manifest row {number} has no image")
+        # JSON manifests may hold numbers, e.g. "template": 1 for templates.json key "1"
+        for column in ('image', 'title', 'genres', 'quality', 'link', 'output'):
+            if row.get(column) is not None:
+                row[column] = str(row[column])
+        row['template'] = str(row.get('template') or 'watermark').strip()
+    return rows
+
+
+def plan_outputs(rows, output_dir, extension):
+    """Give every row a stable output path; repeated names get -2, -3... in manifest order"""
+    seen = {}
+    for row in rows:
+        name = row.get('output')
+        if not name:
+            stem = os.path.splitext(os.path.basename(row['image']))[0]
+            name = f"{stem}-{row['template']}"
+            count = seen[name] = seen.get(name, 0) + 1
+            if count > 1:
+                name = f"{name}-{count}"
+            name = f"{name}.{extension}"
+        row['output_path'] = os.path.join(output_dir, name)
+    return rows
+
+
+def _init_worker(profile):
+    _worker['processor'] = ImageProcessor()
+    _worker['generator'] = TemplateGenerator(MemorySessionStore('templates', ttl=None))
+    _worker['encoder'] = Encoder(profile)
+
+
+def render_row(row):
+    """Render one manifest row to its output file; runs in a pool process"""
+    started = time.perf_counter()
+    result = {'image': row['image'], 'template': row['template'], 'output': row['output_path'], 'link': row.get('link')}
+    try:
+        img = open_image(row['image_path'], max_size=(MAX_INPUT_DIMENSION, MAX_INPUT_DIMENSION))
+        template = row['template']
+        if template == 'watermark':
+            img = _worker['processor'].add_watermark(img)
+        elif template in LEGACY_TEMPLATES:
+            img = _worker['processor'].apply_template(img, template)
+        else:
+            generator = _worker['generator']
+            generator.current_state.set(BULK_USER, {
+                'step': 'template',
+                'title': row.get('title') or '',
+                'genres': row.get('genres') or '',
+                'quality': row.get('quality') or '',
+                'link': row.get('link') or '',
+            })
+            generated = generator.generate_template(template, BULK_USER, img)
+            if not generated:
+                raise ValueError(f"Template {template} could not be rendered")
+            img = generated[0]
+        megapixels = img.width * img.height / 1e6
+        buffer, stats = _worker['encoder'].encode_with_stats(img)
+
+        # Written under a temporary name so a killed run never leaves a half file that looks done
+        partial = row['output_path'] + '.partial'
+        with open(partial, 'wb') as f:
+            f.write(buffer.getbuffer())
+        os.replace(partial, row['output_path'])
+        result.update(ok=True, bytes=stats['bytes'], megapixels=megapixels)
+    except Exception as e:
+        result.update(ok=False, error=str(e))
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render posters in bulk from a manifest")
+    parser.add_argument('images', help="directory holding the manifest's images")
+    parser.add_argument('manifest', help="CSV, JSONL or JSON array manifest")
+    parser.add_argument('--output', required=True, help="directory to write rendered posters to")
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help="render processes (default: all cores)")
+    parser.add_argument('--profile', default='default', choices=sorted(PROFILES), help="encoder profile")
+    parser.add_argument('--force', action='store_true', help="render rows again even if their output exists")
+    args = parser.parse_args(argv)
+
+    images = os.path.abspath(args.images)
+    output_dir = os.path.abspath(args.output)
+    rows = read_manifest(os.path.abspath(args.manifest))
+    os.makedirs(output_dir, exist_ok=True)
+    # Assets are resolved relative to the repo root, like the bot does
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    extension = EXTENSIONS.get(PROFILES[args.profile]['format'], 'img')
+    plan_outputs(rows, output_dir, extension)
+    templates = {'watermark', *LEGACY_TEMPLATES, *TemplateManager().templates}
+    pending, skipped, invalid = [], 0, []
+    for row in rows:
+        row['image_path'] = os.path.join(images, row['image'])
+        if row['template'] not in templates:
+            invalid.append(f"{row['image']} (unknown template {row['template']})")
+        elif not os.path.exists(row['image_path']):
+            invalid.append(row['image'])
+        elif os.path.exists(row['output_path']) and not args.force:
+            skipped += 1
+        else:
+            pending.append(row)
+    for image in invalid:
+        print(f"Skipping {image}")
+    print(f"{len(rows)} rows: {len(pending)} to render, {skipped} already done, {len(invalid)} invalid")
+
+    started = time.monotonic()
+    rendered = failed = 0
+    output_bytes = megapixels = render_seconds = 0.0
+    with open(os.path.join(output_dir, 'index.jsonl'), 'a', encoding='utf-8') as index, \
+            multiprocessing.Pool(args.processes, initializer=_init_worker, initargs=(args.profile,)) as pool:
+        # Results are written as they finish, not when the whole batch is done
+        for result in pool.imap_unordered(render_row, pending):
+            render_seconds += result['seconds']
+            if result['ok']:
+                rendered += 1
+                output_bytes += result['bytes']
+                megapixels += result['megapixels']
+                index.write(json.dumps(result, ensure_ascii=False) + '\n')
+                index.flush()
+            else:
+                failed += 1
+                print(f"Failed {result['image']} ({result['template']}): {result['error']}")
+            done = rendered + failed
+            if done % 10 == 0 or done == len(pending):
+                print(f"  {done}/{len(pending)} ({done / (time.monotonic() - started):.1f} images/s)")
+
+    elapsed = time.monotonic() - started
+    print(
+        f"Rendered {rendered}, failed {failed + len(invalid)}, skipped {skipped} in {elapsed:.1f}s "
+        f"with {args.processes} processes: {rendered / elapsed if elapsed else 0:.1f} images/s, "
+        f"{megapixels / elapsed if elapsed else 0:.1f} MP/s, "
+        f"{render_seconds / max(1, rendered + failed) * 1000:.0f}ms per image, "
+        f"{output_bytes / 2**20:.1f}MB written"
+    )
+    return 1 if failed or invalid else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe, size-bounded least-recently-used cache.
+
+    With ttl set (seconds), entries also expire that long after being stored.
+    With max_weight set, weigher(value) (e.g. a byte size) is summed over all
+    entries and the oldest are evicted to keep the total under the budget.
+    on_evict(key, value) is called for entries pushed out by either bound.
+    """
+
+    def __init__(self, maxsize=128, ttl=None, max_weight=None, weigher=None, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_weight = max_weight
+        self.weigher = weigher
+        self.on_evict = on_evict
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (value, expires_at or None, weight)
+        self._lock = threading.RLock()
+
+    def _lookup(self, key):
+        """Return (found, value), dropping the entry if it has expired"""
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        value, expires_at, weight = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            self.weight -= weight
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def get(self, key, default=None):
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+            return default
+
+    def set(self, key, value, expires_at=None):
+        if expires_at is None and self.ttl is not None:
+            expires_at = time.time() + self.ttl
+        weight = self.weigher(value) if self.weigher else 0
+        evicted = []
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.weight -= old[2]
+            self._data[key] = (value, expires_at, weight)
+            self.weight += weight
+            while len(self._data) > 1 and (
+                len(self._data) > self.maxsize
+                or (self.max_weight is not None and self.weight > self.max_weight)
+            ):
+                old_key, (old_value, _, old_weight) = self._data.popitem(last=False)
+                self.weight -= old_weight
+                evicted.append((old_key, old_value))
+
+        if self.on_evict:
+            for old_key, old_value in evicted:
+                self.on_evict(old_key, old_value)
+
+    def get_or_create(self, key, factory):
+        """Return the cached value for key, building it with factory() on a miss"""
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        # Build outside the lock so slow factories don't serialize other lookups
+        value = factory()
+        self.set(key, value)
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+            self.weight -= entry[2]
+            return entry[0]
+
+    def items(self):
+        """Snapshot of live (key, value, expires_at) entries, oldest first"""
+        now = time.time()
+        with self._lock:
+            return [
+                (key, value, expires_at)
+                for key, (value, expires_at, _) in self._data.items()
+                if expires_at is None or expires_at > now
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._lookup(key)[0]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
\ No newline at end of file
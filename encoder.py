@@ -0,0 +1,124 @@
+import os
+import time
+from io import BytesIO
+from image_processor import stage_timer
+from metrics import metrics
+
+# Named output settings; pick one per deployment with ENCODE_PROFILE.
+# target_bytes searches quality (down to min_quality) for the best result under the cap.
+PROFILES = {
+    # Same bytes as a bare img.save(..., 'JPEG')
+    'default': {'format': 'JPEG', 'quality': 75, 'progressive': False, 'optimize': False, 'subsampling': '4:2:0'},
+    # Cheapest CPU per image
+    'fast': {'format': 'JPEG', 'quality': 80, 'progressive': False, 'optimize': False, 'subsampling': '4:2:0'},
+    # Sharper text and logo edges, larger files
+    'quality': {'format': 'JPEG', 'quality': 92, 'progressive': True, 'optimize': True, 'subsampling': '4:4:4'},
+    # Smallest uploads for slow links
+    'small': {'format': 'JPEG', 'quality': 85, 'progressive': True, 'optimize': True, 'subsampling': '4:2:0',
+              'target_bytes': 350 * 1024, 'min_quality': 55},
+    'webp': {'format': 'WEBP', 'quality': 85, 'method': 4},
+}
+
+ENCODE_PROFILE = os.environ.get("ENCODE_PROFILE", "default")
+# Overrides the profile's size cap in bytes, 0 keeps the profile's setting
+ENCODE_TARGET_BYTES = int(os.environ.get("ENCODE_TARGET_BYTES", 0))
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp', 'PNG': 'png'}
+BYTE_BUCKETS = (25e3, 50e3, 100e3, 200e3, 350e3, 500e3, 1e6, 2e6, 5e6, 10e6)
+
+metrics.describe('encode_output_bytes', "Size of encoded results")
+metrics.describe('encode_passes_total', "Encoder passes, more than one per image when searching for a size cap")
+
+
+class Encoder:
+    """Encodes rendered images for upload using a named profile"""
+
+    def __init__(self, profile=ENCODE_PROFILE, target_bytes=ENCODE_TARGET_BYTES):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown encode profile: {profile}")
+        self.profile = profile
+        self.settings = dict(PROFILES[profile])
+        if target_bytes:
+            self.settings['target_bytes'] = target_bytes
+        # Optional callback(stage, seconds) receiving the encode timing
+        self.on_stage = None
+
+    def _save(self, img, quality, probe=False):
+        options = {key: value for key, value in self.settings.items() if key not in ('target_bytes', 'min_quality')}
+        options['quality'] = quality
+        if probe:
+            # optimize/progressive only ever make JPEGs smaller, so probe without their extra passes
+            options['optimize'] = options['progressive'] = False
+        buffer = BytesIO()
+        try:
+            img.save(buffer, **options)
+        except OSError:
+            if not (options.get('progressive') or options.get('optimize')):
+                raise
+            # Pillow writes these in one block of about a byte per pixel, which very
+            # detailed images overflow; fall back to a baseline JPEG at the same quality
+            metrics.inc('encode_passes_total', {'format': options['format']})
+            options['optimize'] = options['progressive'] = False
+            buffer = BytesIO()
+            img.save(buffer, **options)
+        metrics.inc('encode_passes_total', {'format': options['format']})
+        return buffer
+
+    def _fit(self, img, target_bytes):
+        """Highest quality whose output fits target_bytes, or the lowest allowed if none do"""
+        high = self.settings['quality']
+        low = self.settings.get('min_quality', 50)
+        buffer = self._save(img, high)
+        passes = 1
+        if buffer.tell() <= target_bytes:
+            return buffer, high, passes
+
+        # Binary search the remaining range with cheap probes; size falls monotonically with quality
+        probe = self.settings['format'] == 'JPEG'
+        best, quality = None, low
+        high -= 1
+        while low <= high:
+            middle = (low + high) // 2
+            candidate = self._save(img, middle, probe)
+            passes += 1
+            if candidate.tell() <= target_bytes:
+                best, quality = candidate, middle
+                low = middle + 1
+            else:
+                high = middle - 1
+
+        # Nothing fits: send the smallest allowed result rather than failing
+        if best is None or probe:
+            final = self._save(img, quality)
+            passes += 1
+            if best is None or final.tell() <= best.tell():
+                best = final
+        return best, quality, passes
+
+    def encode_with_stats(self, img, name='poster'):
+        """Encode img into an in-memory file ready for upload, returning (buffer, stats)"""
+        started = time.perf_counter()
+        with stage_timer(self.on_stage, 'encode'):
+            if img.mode not in ('RGB', 'L') and self.settings['format'] == 'JPEG':
+                img = img.convert('RGB')
+            target_bytes = self.settings.get('target_bytes')
+            if target_bytes:
+                buffer, quality, passes = self._fit(img, target_bytes)
+            else:
+                buffer, quality, passes = self._save(img, self.settings['quality']), self.settings['quality'], 1
+
+        size = buffer.tell()
+        buffer.name = f"{name}.{EXTENSIONS.get(self.settings['format'], 'img')}"
+        buffer.seek(0)
+        metrics.observe('encode_output_bytes', size, {'profile': self.profile}, buckets=BYTE_BUCKETS)
+        return buffer, {
+            'profile': self.profile,
+            'format': self.settings['format'],
+            'quality': quality,
+            'passes': passes,
+            'bytes': size,
+            'seconds': time.perf_counter() - started,
+        }
+
+    def encode(self, img, name='poster'):
+        return self.encode_with_stats(img, name)[0]
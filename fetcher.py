@@ -0,0 +1,72 @@
+import os
+import time
+from io import BytesIO
+import requests
+from requests.adapters import HTTPAdapter
+from image_processor import open_image
+from metrics import metrics
+
+URL_CONNECT_TIMEOUT = float(os.environ.get("URL_CONNECT_TIMEOUT", 3.05))
+URL_READ_TIMEOUT = float(os.environ.get("URL_READ_TIMEOUT", 10))
+# Whole download must finish within this many seconds, however slowly bytes trickle in
+URL_FETCH_DEADLINE = float(os.environ.get("URL_FETCH_DEADLINE", 30))
+URL_MAX_BYTES = int(os.environ.get("URL_MAX_BYTES", 20 * 1024 * 1024))
+# Largest image we ever render; Telegram scales photos down to 2560px anyway
+MAX_INPUT_DIMENSION = int(os.environ.get("MAX_INPUT_DIMENSION", 2560))
+CHUNK_SIZE = 64 * 1024
+
+metrics.describe('url_fetch_total', "Image URL downloads, by outcome")
+metrics.describe('url_fetch_seconds', "Time spent downloading image URLs")
+
+
+class FetchError(Exception):
+    pass
+
+
+class ImageFetcher:
+    """Streams images from URLs with timeouts and a byte cap, decoding them downscaled"""
+
+    def __init__(self, max_bytes=URL_MAX_BYTES, max_dimension=MAX_INPUT_DIMENSION):
+        self.max_bytes = max_bytes
+        self.max_size = (max_dimension, max_dimension)
+        self.timeout = (URL_CONNECT_TIMEOUT, URL_READ_TIMEOUT)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def fetch(self, url):
+        """Download url into memory, aborting as soon as it is too big, too slow or not an image"""
+        started = time.monotonic()
+        try:
+            with self.session.get(url, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                content_type = response.headers.get('Content-Type', '')
+                if content_type and not content_type.startswith(('image/', 'application/octet-stream')):
+                    raise FetchError(f"URL is not an image ({content_type})")
+                length = response.headers.get('Content-Length')
+                if length and length.isdigit() and int(length) > self.max_bytes:
+                    raise FetchError(f"Image is too large ({int(length) // 1024 // 1024}MB)")
+
+                buffer = BytesIO()
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    buffer.write(chunk)
+                    if buffer.tell() > self.max_bytes:
+                        raise FetchError(f"Image is larger than {self.max_bytes // 1024 // 1024}MB")
+                    if time.monotonic() - started > URL_FETCH_DEADLINE:
+                        raise FetchError("Image download took too long")
+        except FetchError:
+            metrics.inc('url_fetch_total', {'result': 'rejected'})
+            raise
+        except requests.RequestException as e:
+            metrics.inc('url_fetch_total', {'result': 'failed'})
+            raise FetchError(f"Could not download image: {e}")
+
+        metrics.inc('url_fetch_total', {'result': 'ok'})
+        metrics.observe('url_fetch_seconds', time.monotonic() - started)
+        buffer.seek(0)
+        return buffer
+
+    def fetch_image(self, url):
+        """Download and decode an image, scaled down to the largest size we render"""
+        return open_image(self.fetch(url), max_size=self.max_size)
@@ -0,0 +1,76 @@
+from PIL import Image
+import os
+from cache import LRUCache
+from metrics import metrics
+
+GRADIENT_CACHE_SIZE = int(os.environ.get("GRADIENT_CACHE_SIZE", 8))
+# Entries are single-band alpha masks, one byte per pixel (6MB at 2000x3000)
+GRADIENT_CACHE_BYTES = int(os.environ.get("GRADIENT_CACHE_BYTES", 48 * 1024 * 1024))
+
+_cache = LRUCache(GRADIENT_CACHE_SIZE, max_weight=GRADIENT_CACHE_BYTES, weigher=lambda mask: mask.width * mask.height)
+metrics.register_cache('gradients', _cache)
+
+
+def _bottom_fade(length):
+    """Watermark fade: transparent top, dark bottom 40%"""
+    fade = int(length * 0.4)
+    start = length - fade
+    values = [0] * start
+    for i in range(start, length):
+        alpha = int(255 * (i - start) / fade)
+        values.append(min(alpha + 50, 255))
+    return values
+
+
+def _cinematic_fade(length):
+    """Movie fade: flat 30% on the top half, ramps to black on the bottom half"""
+    half = length / 2
+    return [int(255 * (0.3 if i < half else (i - half) / half)) for i in range(length)]
+
+
+def _series_fade(length):
+    """Series fade: left-to-right ramp up to 70%"""
+    return [int(255 * (i / length) * 0.7) for i in range(length)]
+
+
+# kind -> (alpha profile builder, whether the profile runs along the x axis)
+GRADIENTS = {
+    'bottom': (_bottom_fade, False),
+    'cinematic': (_cinematic_fade, False),
+    'series': (_series_fade, True),
+}
+
+
+def _build_mask(kind, width, height):
+    profile, horizontal = GRADIENTS[kind]
+
+    # Build a single row/column of alpha values and stretch it over the image
+    if horizontal:
+        ramp = Image.new('L', (width, 1))
+        ramp.putdata(profile(width))
+    else:
+        ramp = Image.new('L', (1, height))
+        ramp.putdata(profile(height))
+    return ramp.resize((width, height), Image.NEAREST)
+
+
+def get_mask(kind, size):
+    """Return the cached 'L' alpha mask of the given kind for an image size"""
+    if kind not in GRADIENTS:
+        raise ValueError(f"Unknown gradient: {kind}")
+    width, height = size
+    return _cache.get_or_create((kind, width, height), lambda: _build_mask(kind, width, height))
+
+
+def get_gradient(kind, size):
+    """Return a black RGBA overlay of the given kind for an image size"""
+    overlay = Image.new('RGBA', size, (0, 0, 0, 0))
+    overlay.putalpha(get_mask(kind, size))
+    return overlay
+
+
+def apply_gradient(img, kind):
+    """Composite a gradient over an image, returning a new RGBA image"""
+    if img.mode != 'RGBA':
+        img = img.convert('RGBA')
+    return Image.alpha_composite(img, get_gradient(kind, img.size))
\ No newline at end of file
@@ -1,47 +1,121 @@
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 import os
+import time
+from io import BytesIO
+from contextlib import contextmanager
 from datetime import datetime
+from gradients import apply_gradient
+from assets import assets
+from text_effects import draw_text_effect, offsets
+
+HEADLINE_EFFECT = (
+    (offsets(3, step=2), (0, 0, 0, 255)),
+    (offsets(2), (255, 140, 0, 150)),
+    (((0, 0),), (255, 255, 255, 255)),
+)
+
+def open_image(source, max_size=None):
+    """Open a path, bytes, file-like buffer or Image as an RGB image.
+
+    With max_size (width, height) the image is scaled down to fit it. JPEGs are
+    decoded straight at the nearest 1/2, 1/4 or 1/8 scale, so a huge source
+    never has to be held at full resolution.
+    """
+    if isinstance(source, Image.Image):
+        img = source
+    else:
+        if isinstance(source, (str, os.PathLike)) and not os.path.exists(source):
+            raise FileNotFoundError(f"Input image not found at {source}")
+        if isinstance(source, (bytes, bytearray)):
+            source = BytesIO(source)
+        img = Image.open(source)
+
+    size = None
+    if max_size:
+        scale = min(max_size[0] / img.width, max_size[1] / img.height)
+        if scale < 1:
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            # Only JPEG supports this; the decoder picks the smallest scale still >= size
+            img.draft('RGB', size)
+
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    if size and img.size != size:
+        img = img.resize(size, Image.LANCZOS, reducing_gap=2.0)
+    return img
+
+
+@contextmanager
+def stage_timer(callback, name):
+    """Report how long the block took as callback(name, seconds), if a callback is set"""
+    if callback is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        callback(name, time.perf_counter() - started)
+
 
 class ImageProcessor:
     def __init__(self):
         self.logo_path = os.path.join('assets', 'logo.png')
         self.font_path = os.path.join('assets', 'font.ttf')
+        # Optional callback(stage, seconds) receiving per-stage render timings
+        self.on_stage = None
         
-    def add_watermark(self, image_path, text="CinemazBD"):
+    def add_watermark(self, image, text="CinemazBD"):
+        """Watermark an image given as a path, buffer, bytes or Image"""
         try:
-            # Verify files exist
-            if not os.path.exists(self.logo_path):
-                raise FileNotFoundError(f"Logo file not found at {self.logo_path}")
-            if not os.path.exists(self.font_path):
-                raise FileNotFoundError(f"Font file not found at {self.font_path}")
-            if not os.path.exists(image_path):
-                raise FileNotFoundError(f"Input image not found at {image_path}")
-
-            # Open and convert image
-            img = Image.open(image_path)
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Create gradient overlay
-            gradient = Image.new('RGBA', img.size, (0, 0, 0, 0))
-            draw = ImageDraw.Draw(gradient)
+            # Open and convert image (logo and font are checked by the asset registry)
+            with stage_timer(self.on_stage, 'decode'):
+                img = open_image(image).convert('RGBA')
+            img = self.watermark(img, text)
+            with stage_timer(self.on_stage, 'convert'):
+                return img.convert('RGB')
             
-            # Add stronger vertical gradient at bottom
-            height = img.height
-            for i in range(height - int(height * 0.4), height):
-                alpha = int(255 * (i - (height - int(height * 0.4))) / (int(height * 0.4)))
-                draw.line([(0, i), (img.width, i)], fill=(0, 0, 0, min(alpha + 50, 255)))
-            
-            # Merge gradient with image
-            img = Image.alpha_composite(img.convert('RGBA'), gradient)
+        except Exception as e:
+            raise Exception(f"Image processing error: {str(e)}")
+
+    def apply_template(self, image, template_name="default"):
+        """Apply a template overlay and watermark to a path, buffer, bytes or Image"""
+        try:
+            # Decode once and run every stage on the same RGBA image
+            with stage_timer(self.on_stage, 'decode'):
+                img = open_image(image).convert('RGBA')
+            img = self.overlay_template(img, template_name)
+            img = self.watermark(img)
+            with stage_timer(self.on_stage, 'convert'):
+                return img.convert('RGB')
             
-            # Add logo
-            logo = Image.open(self.logo_path)
+        except Exception as e:
+            raise Exception(f"Template error: {str(e)}")
+
+    def overlay_template(self, img, template_name):
+        """Template stage: add the template's gradient to an RGBA image"""
+        with stage_timer(self.on_stage, 'template'):
+            if template_name == "movie":
+                # Add cinematic gradient
+                img = apply_gradient(img, 'cinematic')
+                
+            elif template_name == "series":
+                # Add TV series style overlay
+                img = apply_gradient(img, 'series')
             
-            # Make logo bigger (25% of image width)
+        return img
+
+    def watermark(self, img, text="CinemazBD"):
+        """Watermark stage: bottom fade, logo and headline on an RGBA image"""
+        # Add stronger vertical gradient at bottom
+        with stage_timer(self.on_stage, 'gradient'):
+            img = apply_gradient(img, 'bottom')
+        
+        with stage_timer(self.on_stage, 'logo'):
+            # Add logo, made bigger (25% of image width)
             logo_width = int(img.width * 0.25)
-            logo_height = int(logo.height * (logo_width / logo.width))
-            logo = logo.resize((logo_width, logo_height))
+            logo = assets.get_logo(logo_width, self.logo_path)
+            logo_height = logo.height
             
             # Position logo at bottom center
             position = (int((img.width - logo_width) / 2), img.height - logo_height - 60)
@@ -55,81 +129,19 @@ class ImageProcessor:
                 img.paste(logo, position, logo)
             else:
                 img.paste(logo, position)
-            
+        
+        with stage_timer(self.on_stage, 'text'):
             # Add text with larger size and better styling
             draw = ImageDraw.Draw(img)
             
             # Main text (CinemazBD)
             main_font_size = int(img.width * 0.1)  # Increased size more
-            main_font = ImageFont.truetype(self.font_path, main_font_size)
+            main_font = assets.get_font(main_font_size, self.font_path)
             main_text = "CinemazBD"
             main_text_width = draw.textlength(main_text, font=main_font)
             main_text_position = (int((img.width - main_text_width) / 2), position[1] - main_font_size - 30)
             
-            # Add strong shadow/glow effect
-            shadow_color = (0, 0, 0, 255)
-            glow_color = (255, 140, 0, 150)  # Orange glow
-            
-            # Add black shadow first
-            for offset in [(x, y) for x in range(-3, 4, 2) for y in range(-3, 4, 2)]:
-                draw.text((main_text_position[0] + offset[0], main_text_position[1] + offset[1]),
-                         main_text, font=main_font, fill=shadow_color)
-            
-            # Add glow effect
-            for offset in [(x, y) for x in range(-2, 3) for y in range(-2, 3)]:
-                draw.text((main_text_position[0] + offset[0], main_text_position[1] + offset[1]),
-                         main_text, font=main_font, fill=glow_color)
-            
-            # Main text in white
-            draw.text(main_text_position, main_text, font=main_font, fill=(255, 255, 255, 255))
-            
-            return img.convert('RGB')
-            
-        except Exception as e:
-            raise Exception(f"Image processing error: {str(e)}")
-
-    def apply_template(self, image_path, template_name="default"):
-        try:
-            img = Image.open(image_path)
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            if template_name == "movie":
-                # Add cinematic gradient
-                gradient = Image.new('RGBA', img.size, (0, 0, 0, 0))
-                draw = ImageDraw.Draw(gradient)
-                
-                # Vertical gradient
-                for i in range(img.height):
-                    alpha = int(255 * (0.3 if i < img.height/2 else (i - img.height/2)/(img.height/2)))
-                    draw.line([(0, i), (img.width, i)], fill=(0, 0, 0, alpha))
-                
-                img = Image.alpha_composite(img.convert('RGBA'), gradient)
-                
-            elif template_name == "series":
-                # Add TV series style overlay
-                gradient = Image.new('RGBA', img.size, (0, 0, 0, 0))
-                draw = ImageDraw.Draw(gradient)
-                
-                # Diagonal gradient
-                for i in range(img.width):
-                    alpha = int(255 * (i/img.width) * 0.7)
-                    draw.line([(i, 0), (i, img.height)], fill=(0, 0, 0, alpha))
-                
-                img = Image.alpha_composite(img.convert('RGBA'), gradient)
-            
-            # Save temporary image
-            temp_path = image_path.replace('.jpg', '_temp.jpg')
-            img.convert('RGB').save(temp_path)
-            
-            # Add watermark
-            result = self.add_watermark(temp_path)
-            
-            # Clean up temp file
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            
-            return result
-            
-        except Exception as e:
-            raise Exception(f"Template error: {str(e)}")
\ No newline at end of file
+            # Add strong shadow/glow effect: black shadow, orange glow, then white text
+            draw_text_effect(img, main_text_position, main_text, main_font, HEADLINE_EFFECT)
+        
+        return img
\ No newline at end of file
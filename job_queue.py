@@ -0,0 +1,211 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from render_queue import QueueFull
+
+# "local" renders in the bot process, "sqlite" hands jobs to render_worker.py processes
+RENDER_BACKEND = os.environ.get("RENDER_BACKEND", "local").lower()
+JOB_QUEUE_DB = os.environ.get("JOB_QUEUE_DB", os.path.join('temp', 'jobs.db'))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", 100))
+# A worker that stops renewing its lease for this long is presumed dead and its job is re-claimed
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 60))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+# Finished jobs are kept this long for stats, then deleted
+JOB_RETENTION = int(os.environ.get("JOB_RETENTION", 24 * 3600))
+JOB_PURGE_EVERY = 200
+
+
+class Job:
+    def __init__(self, id, kind, payload, attempts, enqueued_at):
+        self.id = id
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+        self.enqueued_at = enqueued_at
+
+
+class SQLiteJobQueue:
+    """Durable render job queue shared by the bot and its worker processes.
+
+    Workers claim the oldest queued job under a lease and renew it while
+    they work. A job whose lease runs out, because its worker crashed or
+    hung, goes back to whoever claims next, up to JOB_MAX_ATTEMPTS times.
+    Delivery is at-least-once: a worker that loses its lease may still
+    finish the job.
+    """
+
+    def __init__(self, path=JOB_QUEUE_DB, max_depth=JOB_QUEUE_SIZE):
+        self.path = path
+        self.max_depth = max_depth
+        self._finished = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " kind TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'queued',"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " worker TEXT,"
+            " lease_expires_at REAL,"
+            " enqueued_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL,"
+            " error TEXT"
+            ")"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+
+    def _transaction(self, fn):
+        # BEGIN IMMEDIATE takes the write lock up front, so two claimers can't pick the same row
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn()
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def enqueue(self, kind, payload):
+        """Queue a job and return (job id, jobs ahead of it).
+
+        Raises QueueFull instead of growing past max_depth waiting jobs.
+        """
+        data = json.dumps(payload, separators=(',', ':'))
+
+        def insert():
+            ahead = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if ahead >= self.max_depth:
+                raise QueueFull(f"Job queue is full ({self.max_depth} jobs waiting)")
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (kind, payload, enqueued_at) VALUES (?, ?, ?)",
+                (kind, data, time.time())
+            )
+            return cursor.lastrowid, ahead
+
+        return self._transaction(insert)
+
+    def claim(self, worker):
+        """Lease the oldest runnable job to worker, or return None if there is none"""
+        def take():
+            now = time.time()
+            # Jobs whose worker died on their last allowed attempt are given up on
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, error = 'lease expired'"
+                " WHERE status = 'running' AND lease_expires_at < ? AND attempts >= ?",
+                (now, now, JOB_MAX_ATTEMPTS)
+            )
+            row = self._conn.execute(
+                "SELECT id, kind, payload, attempts, enqueued_at FROM jobs"
+                " WHERE status = 'queued' OR (status = 'running' AND lease_expires_at < ?)"
+                " ORDER BY id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, kind, payload, attempts, enqueued_at = row
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, attempts = ?, lease_expires_at = ?, started_at = ?"
+                " WHERE id = ?",
+                (worker, attempts + 1, now + JOB_LEASE_SECONDS, now, job_id)
+            )
+            return Job(job_id, kind, json.loads(payload), attempts + 1, enqueued_at)
+
+        return self._transaction(take)
+
+    def renew(self, job, worker):
+        """Extend the lease on a running job; False if the worker no longer holds it"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time() + JOB_LEASE_SECONDS, job.id, worker)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job, worker):
+        self._finish(job, worker, 'done')
+
+    def fail(self, job, worker, error):
+        """Record a failed attempt, queueing the job again if it has attempts left"""
+        if job.attempts < JOB_MAX_ATTEMPTS:
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL, lease_expires_at = NULL, error = ?"
+                    " WHERE id = ? AND worker = ? AND status = 'running'",
+                    (str(error), job.id, worker)
+                )
+            return True
+        self._finish(job, worker, 'failed', str(error))
+        return False
+
+    def _finish(self, job, worker, status, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = ?, lease_expires_at = NULL"
+                " WHERE id = ? AND worker = ? AND status = 'running'",
+                (status, time.time(), error, job.id, worker)
+            )
+            self._finished += 1
+            purge = self._finished % JOB_PURGE_EVERY == 0
+        if purge:
+            self.purge()
+
+    def purge(self):
+        """Delete finished jobs older than JOB_RETENTION"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (time.time() - JOB_RETENTION,)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @property
+    def depth(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def stats(self):
+        """Job counts by status, live workers and recent wait/run times"""
+        now = time.time()
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            workers = self._conn.execute(
+                "SELECT COUNT(DISTINCT worker) FROM jobs WHERE status = 'running' AND lease_expires_at >= ?",
+                (now,)
+            ).fetchone()[0]
+            avg_wait, avg_run = self._conn.execute(
+                "SELECT AVG(started_at - enqueued_at), AVG(finished_at - started_at) FROM"
+                " (SELECT * FROM jobs WHERE status = 'done' ORDER BY id DESC LIMIT 100)"
+            ).fetchone()
+        return {
+            'queued': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'busy_workers': workers,
+            'avg_wait': avg_wait or 0.0,
+            'avg_run': avg_run or 0.0,
+        }
+
+
+def open_job_queue(backend=RENDER_BACKEND):
+    """The shared job queue for the configured render backend, None to render in-process"""
+    if backend == 'local':
+        return None
+    if backend == 'sqlite':
+        return SQLiteJobQueue()
+    raise ValueError(f"Unknown render backend: {backend}")
@@ -0,0 +1,120 @@
+"""Job queue scaling check.
+
+Queues synthetic watermark jobs in a scratch SQLite job queue and drains
+them with 1, 2, 4... render worker processes, reporting jobs/s for each.
+Workers talk to a stub bot, so nothing reaches Telegram. With --crash one
+worker is killed mid-job to check that its job is re-claimed.
+
+    python job_queue_check.py --jobs 40 --workers 1 2 4
+    python job_queue_check.py --jobs 10 --workers 2 --crash
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+import job_queue
+import render_worker
+from benchmark import synthetic_jpeg
+from job_queue import SQLiteJobQueue
+from render_worker import RenderWorker
+
+
+class StubBot:
+    """Just enough of telegram.Bot for RenderWorker"""
+
+    def __init__(self, photo_bytes):
+        self.photo_bytes = photo_bytes
+        self.sent = 0
+
+    def get_file(self, file_id):
+        return SimpleNamespace(download=lambda out: out.write(self.photo_bytes))
+
+    def send_photo(self, chat_id, photo, **kwargs):
+        self.sent += 1
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=f'result-{self.sent}')])
+
+    def send_message(self, chat_id, text, **kwargs):
+        pass
+
+    def send_media_group(self, chat_id, media, **kwargs):
+        pass
+
+    def delete_message(self, chat_id, message_id):
+        pass
+
+
+def work(path, photo_bytes, slow):
+    if slow:
+        # Stall long enough to be killed while holding a lease
+        RenderWorker.render = lambda self, spec, image: time.sleep(60)
+    worker = RenderWorker(StubBot(photo_bytes), SQLiteJobQueue(path))
+    worker.run()
+
+
+def fill(queue, jobs, size):
+    for i in range(jobs):
+        photo = {'file_id': f'file-{size}-{i}', 'file_unique_id': f'unique-{size}-{i}'}
+        queue.enqueue('watermark', {'chat_id': 1, 'reply_to': None, 'render': {'op': 'watermark'}, 'photos': [photo]})
+
+
+def drain(queue, path, photo_bytes, workers, crash=False):
+    """Start workers, wait for the queue to empty and return (seconds, stats)"""
+    processes = []
+    if crash:
+        victim = multiprocessing.Process(target=work, args=(path, photo_bytes, True))
+        victim.start()
+        while queue.stats()['running'] == 0:
+            time.sleep(0.05)
+        victim.kill()
+        print(f"Killed worker {victim.pid} while it held a job")
+    started = time.monotonic()
+    for _ in range(workers):
+        process = multiprocessing.Process(target=work, args=(path, photo_bytes, False))
+        process.start()
+        processes.append(process)
+    while True:
+        stats = queue.stats()
+        if stats['queued'] == 0 and stats['running'] == 0:
+            break
+        time.sleep(0.05)
+    elapsed = time.monotonic() - started
+    for process in processes:
+        process.kill()
+        process.join()
+    return elapsed, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=40)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--size', default='1500x2250', help="synthetic photo size, WxH")
+    parser.add_argument('--crash', action='store_true', help="kill a worker mid-job first")
+    args = parser.parse_args()
+
+    size = tuple(int(n) for n in args.size.split('x'))
+    photo_bytes = synthetic_jpeg(size)
+    if args.crash:
+        # Short leases so the killed worker's job comes back quickly
+        job_queue.JOB_LEASE_SECONDS = render_worker.JOB_LEASE_SECONDS = 2
+
+    baseline = None
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'jobs.db')
+            queue = SQLiteJobQueue(path, max_depth=args.jobs)
+            fill(queue, args.jobs, args.size)
+            elapsed, stats = drain(queue, path, photo_bytes, workers, args.crash)
+        rate = args.jobs / elapsed
+        baseline = baseline or rate
+        print(
+            f"{workers} workers: {args.jobs} jobs in {elapsed:.2f}s, {rate:.1f} jobs/s "
+            f"({rate / baseline:.2f}x), {stats['done']} done, {stats['failed']} failed"
+        )
+
+
+if __name__ == '__main__':
+    main()
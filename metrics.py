@@ -0,0 +1,232 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _labels_key(labels):
+    return tuple(sorted((labels or {}).items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+
+class Metrics:
+    """Process-wide counters, histograms and gauges, exported as Prometheus text or JSON"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = defaultdict(dict)  # name -> labels key -> value
+        self._histograms = defaultdict(dict)  # name -> labels key -> Histogram
+        self._gauges = {}  # name -> (callable, label name or None)
+        self._caches = {}  # name -> LRUCache
+        self._local = threading.local()
+
+        self.gauge('process_uptime_seconds', lambda: time.time() - self.started_at, "Seconds since the process started")
+        self.gauge('cache_hit_ratio', lambda: self._cache_stats('hit_ratio'), "Hit ratio of each in-process cache", label='cache')
+        self.gauge('cache_hits', lambda: self._cache_stats('hits'), "Lookups served from each cache", label='cache')
+        self.gauge('cache_misses', lambda: self._cache_stats('misses'), "Lookups that missed each cache", label='cache')
+        self.gauge('cache_entries', lambda: self._cache_stats('__len__'), "Entries held by each cache", label='cache')
+
+    def register_cache(self, name, cache):
+        """Export an LRUCache's hit/miss statistics under the given name"""
+        self._caches[name] = cache
+
+    def _cache_stats(self, attribute):
+        stats = {}
+        for name, cache in list(self._caches.items()):
+            value = getattr(cache, attribute)
+            stats[name] = value() if callable(value) else value
+        return stats
+
+    def describe(self, name, help):
+        self._help[name] = help
+
+    def inc(self, name, labels=None, value=1):
+        key = _labels_key(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, labels=None, buckets=DEFAULT_BUCKETS):
+        """Record value in a histogram; buckets only apply when the series is first created"""
+        key = _labels_key(labels)
+        with self._lock:
+            series = self._histograms[name]
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    def gauge(self, name, fn, help=None, label=None):
+        """Register fn() as a gauge read at export time.
+
+        With label set, fn returns {label value: number}, one series per entry.
+        """
+        self._gauges[name] = (fn, label)
+        if help:
+            self.describe(name, help)
+
+    @contextmanager
+    def timer(self, name, labels=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, labels)
+
+    @contextmanager
+    def track(self, handler):
+        """Count, time and record errors for one handler invocation or job"""
+        previous = getattr(self._local, 'handler', None)
+        self._local.handler = handler
+        labels = {'handler': handler}
+        self.inc('bot_handler_requests_total', labels)
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc('bot_handler_errors_total', labels)
+            raise
+        finally:
+            self.observe('bot_handler_latency_seconds', time.perf_counter() - started, labels)
+            self._local.handler = previous
+
+    def error(self, handler=None):
+        """Count a handled error against the handler currently being tracked"""
+        handler = handler or getattr(self._local, 'handler', None) or 'unknown'
+        self.inc('bot_handler_errors_total', {'handler': handler})
+
+    def stage_observer(self, name='render_stage_seconds'):
+        """Callback for ImageProcessor/TemplateGenerator.on_stage"""
+        return lambda stage, seconds: self.observe(name, seconds, {'stage': stage})
+
+    def _read_gauges(self):
+        values = {}
+        for name, (fn, label) in list(self._gauges.items()):
+            try:
+                value = fn()
+            except Exception as e:
+                print(f"Gauge {name} failed: {e}")
+                continue
+            if label:
+                values[name] = {_labels_key({label: key}): v for key, v in value.items()}
+            else:
+                values[name] = {(): value}
+        return values
+
+    def _snapshot(self):
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {
+                name: {key: (list(h.buckets), list(h.counts), h.sum, h.count) for key, h in series.items()}
+                for name, series in self._histograms.items()
+            }
+        return counters, histograms, self._read_gauges()
+
+    def to_prometheus(self):
+        counters, histograms, gauges = self._snapshot()
+        lines = []
+
+        def header(name, kind):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for name in sorted(counters):
+            header(name, 'counter')
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+
+        for name in sorted(histograms):
+            header(name, 'histogram')
+            for key, (buckets, counts, total, count) in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+
+        for name in sorted(gauges):
+            header(name, 'gauge')
+            for key, value in sorted(gauges[name].items()):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self):
+        counters, histograms, gauges = self._snapshot()
+
+        def series_name(key):
+            return ','.join(f"{name}={value}" for name, value in key) or '_'
+
+        return {
+            'uptime_seconds': time.time() - self.started_at,
+            'counters': {
+                name: {series_name(key): value for key, value in series.items()}
+                for name, series in counters.items()
+            },
+            'histograms': {
+                name: {
+                    series_name(key): {
+                        'count': count,
+                        'sum': total,
+                        'mean': total / count if count else 0.0,
+                        'buckets': dict(zip([str(b) for b in buckets] + ['+Inf'], counts)),
+                    }
+                    for key, (buckets, counts, total, count) in series.items()
+                }
+                for name, series in histograms.items()
+            },
+            'gauges': {
+                name: {series_name(key): value for key, value in series.items()}
+                for name, series in gauges.items()
+            },
+        }
+
+    def counter_total(self, name, labels=None):
+        key = _labels_key(labels)
+        with self._lock:
+            return self._counters.get(name, {}).get(key, 0)
+
+    def histogram_summary(self, name):
+        """{labels key: (count, mean)} for one histogram"""
+        with self._lock:
+            return {key: (h.count, h.mean) for key, h in self._histograms.get(name, {}).items()}
+
+
+metrics = Metrics()
+metrics.describe('bot_handler_requests_total', "Handler invocations and render jobs")
+metrics.describe('bot_handler_errors_total', "Handler invocations and render jobs that failed")
+metrics.describe('bot_handler_latency_seconds', "Handler and render job latency")
+metrics.describe('render_stage_seconds', "Time spent in each rendering stage")
+metrics.describe('render_job_wait_seconds', "Time render jobs spent waiting in the queue")
+metrics.describe('render_job_run_seconds', "Time render jobs spent running")
+metrics.describe('tmdb_request_seconds', "Latency of upstream TMDB API calls")
\ No newline at end of file
@@ -0,0 +1,46 @@
+import os
+import re
+from metrics import metrics
+from source_cache import DiskSpill
+
+TMDB_IMAGE_URL = os.environ.get("TMDB_IMAGE_URL", "https://image.tmdb.org/t/p")
+# Sizes offered by the "brand" buttons; original can be several MB
+POSTER_SIZES = ('w342', 'w780', 'original')
+TMDB_BRAND_SIZE = os.environ.get("TMDB_BRAND_SIZE", "w780")
+POSTER_CACHE_DIR = os.environ.get("POSTER_CACHE_DIR", os.path.join('temp', 'posters'))
+POSTER_CACHE_BYTES = int(os.environ.get("POSTER_CACHE_BYTES", 256 * 1024 * 1024))
+
+# TMDB poster paths look like /kqjL17yufvn9OVLyXYpvtyrFfak.jpg
+POSTER_PATH = re.compile(r'^/[A-Za-z0-9_-]+\.(jpg|jpeg|png)$')
+
+metrics.describe('tmdb_poster_cache_total', "TMDB poster lookups, served from disk or downloaded")
+
+
+class PosterCache:
+    """TMDB poster bytes by size and poster_path in a size-bounded disk LRU.
+
+    Popular titles get branded again and again, so their posters are
+    downloaded once and then read from local disk.
+    """
+
+    def __init__(self, fetcher, directory=POSTER_CACHE_DIR, max_bytes=POSTER_CACHE_BYTES):
+        self.fetcher = fetcher
+        self.disk = DiskSpill(directory, max_bytes)
+
+    def get(self, poster_path, size=TMDB_BRAND_SIZE):
+        """Raw poster bytes, downloading them only on a miss"""
+        if size not in POSTER_SIZES:
+            raise ValueError(f"Unknown poster size: {size}")
+        if not POSTER_PATH.match(poster_path):
+            raise ValueError(f"Invalid poster path: {poster_path}")
+
+        name = size + '_' + poster_path[1:]
+        data = self.disk.get(name)
+        if data is not None:
+            metrics.inc('tmdb_poster_cache_total', {'result': 'hit'})
+            return data
+
+        metrics.inc('tmdb_poster_cache_total', {'result': 'miss'})
+        data = self.fetcher.fetch(f"{TMDB_IMAGE_URL}/{size}{poster_path}").getvalue()
+        self.disk.put(name, data)
+        return data
@@ -0,0 +1,124 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from metrics import metrics
+
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", 2))
+RENDER_QUEUE_SIZE = int(os.environ.get("RENDER_QUEUE_SIZE", 20))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class RenderJob:
+    def __init__(self, name, fn, args, kwargs):
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+
+    @property
+    def wait_time(self):
+        return (self.started_at or time.monotonic()) - self.enqueued_at
+
+    @property
+    def run_time(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+
+class RenderQueue:
+    """Bounded job queue served by a fixed pool of render worker threads"""
+
+    def __init__(self, workers=RENDER_WORKERS, max_depth=RENDER_QUEUE_SIZE):
+        self.workers = workers
+        self.max_depth = max_depth
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.recent = deque(maxlen=100)  # finished jobs, newest last
+
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"render-{i}", daemon=True).start()
+
+    def submit(self, name, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) and return how many jobs are ahead of it.
+
+        Raises QueueFull instead of blocking when max_depth jobs are waiting.
+        """
+        job = RenderJob(name, fn, args, kwargs)
+        with self._lock:
+            idle_workers = self.workers - self._running
+            position = max(0, self._waiting + 1 - idle_workers)
+            if position > self.max_depth:
+                self.rejected += 1
+                raise QueueFull(f"Render queue is full ({self.max_depth} jobs waiting)")
+            self._waiting += 1
+        self._queue.put(job)
+        return position
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._waiting -= 1
+                self._running += 1
+            job.started_at = time.monotonic()
+            metrics.observe('render_job_wait_seconds', job.wait_time)
+            try:
+                with metrics.track(job.name):
+                    job.fn(*job.args, **job.kwargs)
+            except Exception as e:
+                job.error = e
+                print(f"Render job {job.name} failed: {e}")
+            job.finished_at = time.monotonic()
+            metrics.observe('render_job_run_seconds', job.run_time)
+
+            with self._lock:
+                self._running -= 1
+                if job.error:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+                self.recent.append(job)
+
+    @property
+    def depth(self):
+        return self._waiting
+
+    def stats(self):
+        """Snapshot of queue depth and wait/run times of recent jobs"""
+        with self._lock:
+            recent = list(self.recent)
+            stats = {
+                'workers': self.workers,
+                'running': self._running,
+                'waiting': self._waiting,
+                'max_depth': self.max_depth,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+            }
+        waits = [job.wait_time for job in recent]
+        runs = [job.run_time for job in recent]
+        stats['avg_wait'] = sum(waits) / len(waits) if waits else 0.0
+        stats['max_wait'] = max(waits, default=0.0)
+        stats['avg_run'] = sum(runs) / len(runs) if runs else 0.0
+        stats['max_run'] = max(runs, default=0.0)
+        stats['recent'] = [
+            {'name': job.name, 'wait': job.wait_time, 'run': job.run_time, 'ok': job.error is None}
+            for job in recent[-10:]
+        ]
+        return stats
\ No newline at end of file
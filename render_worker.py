@@ -0,0 +1,218 @@
+"""Render worker for RENDER_BACKEND=sqlite.
+
+Claims render jobs queued by bot.py from the shared SQLite job queue,
+renders them and sends the results straight to the chat. Run as many as
+the host has cores for; they coordinate only through the queue file.
+
+    python render_worker.py --processes 4
+
+Each process rate limits its own sends, so with several processes lower
+SEND_GLOBAL_RATE to keep their total under Telegram's limit.
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
+from telegram.error import BadRequest
+from telegram.utils.request import Request
+from encoder import Encoder
+from fetcher import ImageFetcher
+from image_processor import ImageProcessor, open_image
+from job_queue import SQLiteJobQueue, JOB_LEASE_SECONDS
+from metrics import metrics
+from poster_cache import PosterCache
+from result_cache import ResultCache
+from send_scheduler import SendScheduler, ScheduledBot, SEND_WORKERS
+from session_store import as_photo
+from source_cache import SourceCache
+from template_generator.generator import TemplateGenerator
+
+# Seconds between polls of an empty queue
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 0.5))
+MEDIA_GROUP_LIMIT = 10  # Bot API maximum photos per send_media_group
+
+
+class RenderWorker:
+    """Claims jobs from a SQLiteJobQueue one at a time and delivers their results"""
+
+    def __init__(self, bot, queue, name=None):
+        self.bot = bot
+        self.queue = queue
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.image_processor = ImageProcessor()
+        self.template_generator = TemplateGenerator()
+        self.encoder = Encoder()
+        self.fetcher = ImageFetcher()
+        self.posters = PosterCache(self.fetcher)
+        self.result_cache = ResultCache()
+        self.source_cache = SourceCache()
+        self.current = None
+        self._stop = threading.Event()
+
+        self.image_processor.on_stage = metrics.stage_observer()
+        self.template_generator.on_stage = metrics.stage_observer()
+        self.encoder.on_stage = metrics.stage_observer()
+        threading.Thread(target=self._renew_leases, name="lease", daemon=True).start()
+
+    def _renew_leases(self):
+        # Renewing well inside the lease keeps a slow render from being handed to another worker
+        while not self._stop.wait(JOB_LEASE_SECONDS / 3):
+            job = self.current
+            if job and not self.queue.renew(job, self.name):
+                print(f"Lost the lease on job {job.id}, another worker may run it too")
+
+    def render(self, spec, image):
+        op = spec['op']
+        if op == 'watermark':
+            return self.image_processor.add_watermark(image)
+        if op == 'template':
+            return self.image_processor.apply_template(image, spec['template'])
+        if op == 'generate':
+            templates = self.template_generator.templates
+            return templates.apply_template(image, spec['template'], spec['fields'], self.template_generator.on_stage)
+        raise ValueError(f"Unknown render operation: {op}")
+
+    def cache_key(self, source, spec):
+        """Same keys as PosterBot uses for the same request"""
+        op = spec['op']
+        if op == 'watermark':
+            return self.result_cache.key(source, 'watermark')
+        if op == 'template':
+            return self.result_cache.key(source, 'template', spec['template'])
+        fields = spec['fields']
+        version = self.template_generator.template_version(spec['template'])
+        return self.result_cache.key(
+            source, 'generate', spec['template'],
+            (fields['title'], fields['genres'], fields['quality'], version)
+        )
+
+    def run_job(self, job):
+        payload = job.payload
+        spec = payload['render']
+        chat_id = payload['chat_id']
+        send_options = {'reply_to_message_id': payload.get('reply_to'), 'allow_sending_without_reply': True}
+        if spec.get('button'):
+            text, link = spec['button']
+            send_options['reply_markup'] = InlineKeyboardMarkup([[InlineKeyboardButton(text, url=link)]])
+
+        if 'url' in payload:
+            with metrics.timer('render_stage_seconds', {'stage': 'fetch'}):
+                image = self.fetcher.fetch_image(payload['url'])
+            self.bot.send_photo(chat_id, self.encoder.encode(self.render(spec, image)), **send_options)
+        elif 'poster' in payload:
+            path, size = payload['poster']['path'], payload['poster']['size']
+            load = lambda: open_image(self.posters.get(path, size), max_size=self.fetcher.max_size)
+            self.send_single(chat_id, f"tmdb_{size}{path}", load, spec, send_options)
+        elif len(payload['photos']) > 1:
+            self.send_album(chat_id, [as_photo(p) for p in payload['photos']], spec, send_options)
+        else:
+            photo = as_photo(payload['photos'][0])
+            load = lambda: self.source_cache.get_image(self.bot, photo)
+            self.send_single(chat_id, photo.file_unique_id, load, spec, send_options)
+
+        if payload.get('delete_message_id'):
+            try:
+                self.bot.delete_message(chat_id, payload['delete_message_id'])
+            except BadRequest:
+                pass
+
+    def send_single(self, chat_id, source, load, spec, send_options):
+        """Send the cached result for source if there is one, otherwise load(), render and send it"""
+        cache_key = self.cache_key(source, spec)
+        file_id = self.result_cache.get(cache_key)
+        if file_id:
+            try:
+                return self.bot.send_photo(chat_id, file_id, **send_options)
+            except BadRequest:
+                self.result_cache.discard(cache_key)
+
+        image = load()
+        sent = self.bot.send_photo(chat_id, self.encoder.encode(self.render(spec, image)), **send_options)
+        self.result_cache.put(cache_key, sent.photo[-1].file_id)
+        return sent
+
+    def send_album(self, chat_id, photos, spec, send_options):
+        started = time.monotonic()
+        images = [self.render(spec, self.source_cache.get_image(self.bot, photo)) for photo in photos]
+        rendered = time.monotonic()
+        for i in range(0, len(images), MEDIA_GROUP_LIMIT):
+            media = [
+                InputMediaPhoto(self.encoder.encode(img, name=f'poster_{i + n}'))
+                for n, img in enumerate(images[i:i + MEDIA_GROUP_LIMIT])
+            ]
+            self.bot.send_media_group(chat_id, media, reply_to_message_id=send_options['reply_to_message_id'],
+                                      allow_sending_without_reply=True)
+        finished = time.monotonic()
+        self.bot.send_message(
+            chat_id,
+            f"✅ {len(images)} টি ছবি প্রসেস হয়েছে\n"
+            f"রেন্ডার: {rendered - started:.1f}s, আপলোড: {finished - rendered:.1f}s"
+        )
+
+    def run_once(self):
+        """Claim and run one job; False if the queue was empty"""
+        job = self.queue.claim(self.name)
+        if job is None:
+            return False
+        self.current = job
+        metrics.observe('render_job_wait_seconds', time.time() - job.enqueued_at)
+        try:
+            with metrics.timer('render_job_run_seconds'), metrics.track(job.kind):
+                self.run_job(job)
+        except Exception as e:
+            retrying = self.queue.fail(job, self.name, e)
+            print(f"Job {job.id} ({job.kind}) failed on attempt {job.attempts}: {e}")
+            if not retrying:
+                self.bot.send_message(job.payload['chat_id'], f"ছবি প্রসেস করতে সমস্যা হয়েছে: {str(e)}")
+        else:
+            self.queue.complete(job, self.name)
+        finally:
+            self.current = None
+        return True
+
+    def run(self):
+        print(f"Render worker {self.name} waiting for jobs in {self.queue.path}")
+        while not self._stop.is_set():
+            if not self.run_once():
+                self._stop.wait(JOB_POLL_INTERVAL)
+
+    def stop(self):
+        self._stop.set()
+
+
+def run_worker():
+    token = os.environ.get("BOT_TOKEN", "YOUR_BOT_TOKEN")
+    request = Request(con_pool_size=SEND_WORKERS + 4)
+    bot = ScheduledBot(token, SendScheduler(), request=request)
+    worker = RenderWorker(bot, SQLiteJobQueue())
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=1, help="worker processes to start")
+    args = parser.parse_args()
+
+    os.makedirs('temp', exist_ok=True)
+    if args.processes == 1:
+        run_worker()
+        return
+    processes = [multiprocessing.Process(target=run_worker, name=f"render-worker-{i}") for i in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import os
+import threading
+from assets import assets
+from cache import LRUCache
+from metrics import metrics
+
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 1000))
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", 7 * 24 * 3600))
+
+
+class ResultCache:
+    """Maps a render request to the Telegram file_id of its already-uploaded result.
+
+    Keys include the current logo/font version, and the whole cache is
+    dropped as soon as either asset changes on disk.
+    """
+
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL):
+        self.cache = LRUCache(maxsize, ttl)
+        metrics.register_cache('results', self.cache)
+        self._asset_version = None
+        self._lock = threading.Lock()
+
+    def key(self, file_unique_id, operation, template=None, params=()):
+        """Build the cache key for rendering a source photo with an operation"""
+        version = assets.version()
+        with self._lock:
+            if version != self._asset_version:
+                self.cache.clear()
+                self._asset_version = version
+        return (file_unique_id, operation, template, tuple(params), version)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def put(self, key, file_id):
+        self.cache.set(key, file_id)
+
+    def discard(self, key):
+        self.cache.pop(key)
+
+    def __contains__(self, key):
+        return key in self.cache
\ No newline at end of file
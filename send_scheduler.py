@@ -0,0 +1,227 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from telegram import Bot
+from cache import LRUCache
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+from metrics import metrics
+
+# Bot API limits: ~30 messages/s overall, 1/s per private chat, 20/min per group
+SEND_GLOBAL_RATE = float(os.environ.get("SEND_GLOBAL_RATE", 30))
+SEND_PRIVATE_RATE = float(os.environ.get("SEND_PRIVATE_RATE", 1))
+SEND_GROUP_RATE = float(os.environ.get("SEND_GROUP_RATE", 20 / 60))
+# Short bursts allowed per chat before the rate applies
+SEND_CHAT_BURST = int(os.environ.get("SEND_CHAT_BURST", 3))
+# Chats whose buckets are remembered; the least recently used are forgotten beyond this
+SEND_MAX_CHATS = int(os.environ.get("SEND_MAX_CHATS", 10000))
+SEND_WORKERS = int(os.environ.get("SEND_WORKERS", 4))
+SEND_RETRIES = int(os.environ.get("SEND_RETRIES", 4))
+SEND_BACKOFF = float(os.environ.get("SEND_BACKOFF", 1.0))
+
+# Lower is sent first
+TEXT, PHOTO, ALBUM = 0, 1, 2
+
+metrics.describe('outbound_sends_total', "Outgoing Bot API sends, by method and outcome")
+metrics.describe('outbound_send_wait_seconds', "Time sends spent waiting for rate limit tokens")
+metrics.describe('outbound_retry_after_total', "Flood control responses from Telegram")
+
+
+class TokenBucket:
+    """Token bucket whose balance may go negative.
+
+    A send costing more than the burst size is let through once the bucket
+    is full, and the excess is paid back before the next send can go.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # set from Telegram's retry_after
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost, now):
+        """Seconds until a send of this cost may go, 0 if it may go now"""
+        self._refill(now)
+        cost = min(cost, self.capacity)
+        blocked = max(0.0, self.blocked_until - now)
+        if self.tokens >= cost:
+            return blocked
+        return max(blocked, (cost - self.tokens) / self.rate)
+
+    def take(self, cost):
+        # Charged in full, so a 10-photo album uses 10 tokens of the chat's budget
+        self.tokens -= cost
+
+
+class SendJob:
+    def __init__(self, chat_id, priority, cost, method, fn, args, kwargs):
+        self.chat_id = chat_id
+        self.priority = priority
+        self.cost = cost
+        self.method = method
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.attempts = 0
+        self.not_before = 0.0
+        self.enqueued_at = time.monotonic()
+        self.future = Future()
+
+
+class SendScheduler:
+    """Rate-limited, prioritised sender for outgoing Bot API calls.
+
+    Each send takes tokens from a global bucket and from its chat's bucket.
+    Workers always pick the highest-priority job that can go now, so text
+    replies overtake photo uploads that are waiting for their chat's limit.
+    RetryAfter pauses the chat for as long as Telegram asks; network errors
+    are retried with jittered exponential backoff.
+    """
+
+    def __init__(self, workers=SEND_WORKERS):
+        self.global_bucket = TokenBucket(SEND_GLOBAL_RATE, SEND_GLOBAL_RATE)
+        self.chats = LRUCache(SEND_MAX_CHATS)  # chat id -> TokenBucket
+        self.jobs = []  # pending SendJobs, kept in priority then arrival order
+        self._cond = threading.Condition()
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"sender-{i}", daemon=True).start()
+
+    def _bucket(self, chat_id):
+        def create():
+            # Group and channel ids are negative
+            rate = SEND_GROUP_RATE if isinstance(chat_id, int) and chat_id < 0 else SEND_PRIVATE_RATE
+            return TokenBucket(rate, SEND_CHAT_BURST)
+        return self.chats.get_or_create(chat_id, create)
+
+    def submit(self, chat_id, priority, method, fn, *args, cost=1, **kwargs):
+        """Queue fn(*args, **kwargs) and return a Future for its result"""
+        job = SendJob(chat_id, priority, cost, method, fn, args, kwargs)
+        self._enqueue(job)
+        return job.future
+
+    def send(self, chat_id, priority, method, fn, *args, cost=1, **kwargs):
+        """Queue a send and block until it has gone out, returning its result"""
+        return self.submit(chat_id, priority, method, fn, *args, cost=cost, **kwargs).result()
+
+    def _enqueue(self, job):
+        with self._cond:
+            index = len(self.jobs)
+            while index and self.jobs[index - 1].priority > job.priority:
+                index -= 1
+            self.jobs.insert(index, job)
+            self._cond.notify()
+
+    def _next_job(self):
+        """Pop the first job allowed to go now, or return how long until one might be"""
+        now = time.monotonic()
+        global_wait = self.global_bucket.wait_time(1, now)
+        soonest = None
+        for index, job in enumerate(self.jobs):
+            wait = max(global_wait, job.not_before - now, self._bucket(job.chat_id).wait_time(job.cost, now))
+            if wait <= 0:
+                del self.jobs[index]
+                self.global_bucket.take(job.cost)
+                self._bucket(job.chat_id).take(job.cost)
+                return job, None
+            soonest = wait if soonest is None else min(soonest, wait)
+        return None, soonest
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job, wait = self._next_job()
+                while job is None:
+                    self._cond.wait(wait)
+                    job, wait = self._next_job()
+            self._run(job)
+
+    def _run(self, job):
+        if job.attempts == 0:
+            metrics.observe('outbound_send_wait_seconds', time.monotonic() - job.enqueued_at, {'method': job.method})
+        job.attempts += 1
+        labels = {'method': job.method}
+        try:
+            if job.attempts > 1:
+                # Uploads read their buffer when the request is built, rewind it for the retry
+                for value in list(job.args) + list(job.kwargs.values()):
+                    if hasattr(value, 'seek'):
+                        value.seek(0)
+            result = job.fn(*job.args, **job.kwargs)
+        except RetryAfter as e:
+            metrics.inc('outbound_sends_total', dict(labels, result='retry_after'))
+            metrics.inc('outbound_retry_after_total')
+            with self._cond:
+                bucket = self._bucket(job.chat_id)
+                bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + e.retry_after)
+            self._retry(job, e, 0)
+        except BadRequest as e:
+            # A subclass of NetworkError, but retrying the same request can't help
+            metrics.inc('outbound_sends_total', dict(labels, result='failed'))
+            job.future.set_exception(e)
+        except (TimedOut, NetworkError) as e:
+            metrics.inc('outbound_sends_total', dict(labels, result='network_error'))
+            self._retry(job, e, SEND_BACKOFF * 2 ** (job.attempts - 1) * random.uniform(0.5, 1.5))
+        except Exception as e:
+            metrics.inc('outbound_sends_total', dict(labels, result='failed'))
+            job.future.set_exception(e)
+        else:
+            metrics.inc('outbound_sends_total', dict(labels, result='sent'))
+            job.future.set_result(result)
+
+    def _retry(self, job, error, delay):
+        if job.attempts > SEND_RETRIES:
+            print(f"Giving up on {job.method} to {job.chat_id} after {job.attempts} attempts: {error}")
+            job.future.set_exception(error)
+            return
+        job.not_before = time.monotonic() + delay
+        self._enqueue(job)
+
+    @property
+    def depth(self):
+        return len(self.jobs)
+
+
+def _report_failure(future):
+    error = future.exception()
+    if error:
+        print(f"Message could not be sent: {error}")
+
+
+class ScheduledBot(Bot):
+    """Bot whose message sends go through a SendScheduler.
+
+    Message.reply_* calls end up here, so every handler is rate limited
+    without changes at the call sites. Text messages are queued and a
+    Future is returned straight away, so a handler on the dispatcher thread
+    never waits for a chat's limit. Photos, documents and albums block until
+    sent because their callers need the returned file_id.
+    """
+
+    def __init__(self, token, scheduler, **kwargs):
+        super().__init__(token, **kwargs)
+        self._scheduler = scheduler
+
+    def send_message(self, chat_id, *args, **kwargs):
+        future = self._scheduler.submit(chat_id, TEXT, 'send_message', super().send_message, chat_id, *args, **kwargs)
+        future.add_done_callback(_report_failure)
+        return future
+
+    def send_photo(self, chat_id, *args, **kwargs):
+        return self._scheduler.send(chat_id, PHOTO, 'send_photo', super().send_photo, chat_id, *args, **kwargs)
+
+    def send_document(self, chat_id, *args, **kwargs):
+        return self._scheduler.send(chat_id, PHOTO, 'send_document', super().send_document, chat_id, *args, **kwargs)
+
+    def send_media_group(self, chat_id, media, *args, **kwargs):
+        # Every item of an album counts against the limits
+        return self._scheduler.send(
+            chat_id, ALBUM, 'send_media_group', super().send_media_group, chat_id, media, *args,
+            cost=len(media), **kwargs
+        )
@@ -0,0 +1,87 @@
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Telegram opens up to max_connections webhook connections at once
+    request_queue_size = 128
+
+
+class HealthServer:
+    """Small threaded HTTP server for health checks and metrics.
+
+    Routes map (method, path) to a function taking the request body and
+    returning (status, content_type, body).
+    """
+
+    def __init__(self, port=8080, host=''):
+        self.port = port
+        self.host = host
+        self.routes = {}
+        self._server = None
+        self.add_route('GET', '/', lambda body: (200, 'text/plain', b"OK"))
+
+    def add_route(self, method, path, handler):
+        self.routes[(method, path)] = handler
+
+    def add_json_route(self, path, fn):
+        self.add_route('GET', path, lambda body: (200, 'application/json', json.dumps(fn(), default=str).encode()))
+
+    def _make_handler(self):
+        routes = self.routes
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def _handle(self, method):
+                path = self.path.split('?', 1)[0]
+                route = routes.get((method, path))
+                if route is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                try:
+                    status, content_type, payload = route(body)
+                except Exception as e:
+                    print(f"HTTP {method} {path} failed: {e}")
+                    status, content_type, payload = 500, 'text/plain', b"Internal error"
+
+                self.send_response(status)
+                self.send_header('Content-type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        return RequestHandler
+
+    def serve_forever(self):
+        try:
+            server = self._server = _Server((self.host, self.port), self._make_handler())
+            print(f"Health check server running on port {self.port}")
+            server.serve_forever()
+        except Exception as e:
+            print(f"Health server error: {e}")
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        """Stop accepting requests and close the listening socket"""
+        server, self._server = self._server, None
+        if server:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,138 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from cache import LRUCache
+
+# "sqlite" keeps sessions across restarts, "memory" only bounds them
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "sqlite").lower()
+SESSION_DB = os.environ.get("SESSION_DB", os.path.join('temp', 'sessions.db'))
+SESSION_MAX_USERS = int(os.environ.get("SESSION_MAX_USERS", 10000))
+# Saved photos stay usable for a day, abandoned /t sessions expire after an hour
+PHOTO_SESSION_TTL = int(os.environ.get("PHOTO_SESSION_TTL", 24 * 3600))
+TEMPLATE_SESSION_TTL = int(os.environ.get("TEMPLATE_SESSION_TTL", 3600))
+# Expired rows are deleted every this many writes
+SESSION_PURGE_EVERY = 500
+
+# Just enough of a Telegram PhotoSize to download it and key caches on it
+PhotoRef = namedtuple('PhotoRef', ['file_id', 'file_unique_id'])
+
+
+def photo_ref(photo):
+    """Compact, JSON-friendly record of a PhotoSize for storing in a session"""
+    return {'file_id': photo.file_id, 'file_unique_id': photo.file_unique_id}
+
+
+def as_photo(record):
+    """Turn a stored photo record back into something SourceCache can fetch"""
+    return PhotoRef(record['file_id'], record['file_unique_id'])
+
+
+class MemorySessionStore:
+    """Per-user session records in a size- and time-bounded LRU.
+
+    Records are stored serialized, so get() always returns a fresh copy and
+    changes only take effect once written back with set(), as with SQLite.
+    """
+
+    def __init__(self, namespace, ttl, maxsize=SESSION_MAX_USERS):
+        self.namespace = namespace
+        self.cache = LRUCache(maxsize, ttl)
+
+    def get(self, user_id):
+        data = self.cache.get(user_id)
+        return json.loads(data) if data is not None else None
+
+    def set(self, user_id, record):
+        self.cache.set(user_id, json.dumps(record, separators=(',', ':')))
+
+    def delete(self, user_id):
+        self.cache.pop(user_id)
+
+    def close(self):
+        pass
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+
+class SQLiteSessionStore:
+    """Per-user session records in a SQLite table, surviving restarts.
+
+    Every namespace shares one database file; expired rows are skipped on
+    read and purged periodically on write.
+    """
+
+    def __init__(self, namespace, ttl, path=SESSION_DB):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " namespace TEXT NOT NULL,"
+            " user_id TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, user_id)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+        self.purge()
+
+    def get(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM sessions WHERE namespace = ? AND user_id = ? AND expires_at > ?",
+                (self.namespace, str(user_id), time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, user_id, record):
+        data = json.dumps(record, separators=(',', ':'))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (namespace, user_id, data, expires_at) VALUES (?, ?, ?, ?)",
+                (self.namespace, str(user_id), data, time.time() + self.ttl)
+            )
+            self._writes += 1
+            purge = self._writes % SESSION_PURGE_EVERY == 0
+        if purge:
+            self.purge()
+
+    def delete(self, user_id):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM sessions WHERE namespace = ? AND user_id = ?",
+                (self.namespace, str(user_id))
+            )
+
+    def purge(self):
+        """Delete every expired session, in all namespaces"""
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+
+def open_session_store(namespace, ttl, backend=SESSION_BACKEND):
+    """Create the configured session store for a namespace"""
+    if backend == 'memory':
+        return MemorySessionStore(namespace, ttl)
+    if backend == 'sqlite':
+        return SQLiteSessionStore(namespace, ttl)
+    raise ValueError(f"Unknown session backend: {backend}")
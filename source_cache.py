@@ -0,0 +1,205 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+from cache import LRUCache
+from metrics import metrics
+from image_processor import open_image
+
+SOURCE_CACHE_BYTES = int(os.environ.get("SOURCE_CACHE_BYTES", 64 * 1024 * 1024))
+# Budget for decoded RGB images, 0 disables keeping decoded copies
+SOURCE_CACHE_DECODED_BYTES = int(os.environ.get("SOURCE_CACHE_DECODED_BYTES", 128 * 1024 * 1024))
+# Optional directory that photos evicted from memory are spilled to
+SOURCE_CACHE_DIR = os.environ.get("SOURCE_CACHE_DIR")
+SOURCE_CACHE_DISK_BYTES = int(os.environ.get("SOURCE_CACHE_DISK_BYTES", 512 * 1024 * 1024))
+# Background download + decode of saved photos, 0 workers disables it
+PREFETCH_WORKERS = int(os.environ.get("PREFETCH_WORKERS", 2))
+PREFETCH_MAX_PENDING = int(os.environ.get("PREFETCH_MAX_PENDING", 20))
+# Skip prefetching once system memory use is above this percentage
+PREFETCH_MAX_MEMORY_PERCENT = float(os.environ.get("PREFETCH_MAX_MEMORY_PERCENT", 85))
+
+metrics.describe('source_prefetch_total', "Background photo prefetches, by outcome")
+
+
+def _image_bytes(img):
+    return img.width * img.height * len(img.getbands())
+
+
+class DiskSpill:
+    """Size-bounded directory of spilled files, evicting least recently used first"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._files = OrderedDict()  # name -> size
+        self._total = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(directory):
+            stat = os.stat(os.path.join(directory, name))
+            entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self._total += size
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def get(self, name):
+        with self._lock:
+            if name not in self._files:
+                return None
+            self._files.move_to_end(name)
+        try:
+            with open(self._path(name), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self._total -= self._files.pop(name, 0)
+            return None
+
+    def put(self, name, data):
+        with open(self._path(name), 'wb') as f:
+            f.write(data)
+        with self._lock:
+            self._total -= self._files.pop(name, 0)
+            self._files[name] = len(data)
+            self._total += len(data)
+            while self._total > self.max_bytes and len(self._files) > 1:
+                old_name, size = self._files.popitem(last=False)
+                self._total -= size
+                try:
+                    os.remove(self._path(old_name))
+                except FileNotFoundError:
+                    pass
+
+
+class SourceCache:
+    """Downloaded source photos keyed by Telegram file_unique_id.
+
+    Raw bytes live in a byte-budgeted LRU (spilling to disk when SOURCE_CACHE_DIR
+    is set) and decoded images in a second one, so repeated operations on the
+    same upload cost a single Bot API download.
+    """
+
+    def __init__(self, max_bytes=SOURCE_CACHE_BYTES, decoded_bytes=SOURCE_CACHE_DECODED_BYTES,
+                 spill_dir=SOURCE_CACHE_DIR, spill_bytes=SOURCE_CACHE_DISK_BYTES):
+        self.spill = DiskSpill(spill_dir, spill_bytes) if spill_dir else None
+        self.raw = LRUCache(
+            maxsize=10000,
+            max_weight=max_bytes,
+            weigher=len,
+            on_evict=self._spill if self.spill else None,
+        )
+        self.decoded = LRUCache(maxsize=10000, max_weight=decoded_bytes, weigher=_image_bytes) if decoded_bytes else None
+        self.downloads = 0
+        self.prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='prefetch') if PREFETCH_WORKERS else None
+        self._prefetches = {}  # file_unique_id -> (future, cancelled event)
+        self._lock = threading.Lock()
+        metrics.register_cache('source_raw', self.raw)
+        if self.decoded is not None:
+            metrics.register_cache('source_decoded', self.decoded)
+
+    def _spill(self, file_unique_id, data):
+        try:
+            self.spill.put(file_unique_id, data)
+        except Exception as e:
+            print(f"Could not spill {file_unique_id} to disk: {e}")
+
+    def get_bytes(self, file_unique_id):
+        data = self.raw.get(file_unique_id)
+        if data is None and self.spill:
+            data = self.spill.get(file_unique_id)
+            if data is not None:
+                self.raw.set(file_unique_id, data)
+        return data
+
+    def fetch(self, bot, photo):
+        """Return the raw bytes of a Telegram photo, downloading it only on a miss"""
+        data = self.get_bytes(photo.file_unique_id)
+        if data is None:
+            buffer = BytesIO()
+            bot.get_file(photo.file_id).download(out=buffer)
+            self.downloads += 1
+            data = buffer.getvalue()
+            self.raw.set(photo.file_unique_id, data)
+        return data
+
+    @staticmethod
+    def _memory_pressure():
+        import psutil
+        return psutil.virtual_memory().percent > PREFETCH_MAX_MEMORY_PERCENT
+
+    def prefetch(self, bot, photo):
+        """Start downloading and decoding a photo in the background, ahead of its render"""
+        if self.prefetch_pool is None:
+            return
+        file_unique_id = photo.file_unique_id
+        if self.decoded is not None and file_unique_id in self.decoded:
+            return
+        if len(self._prefetches) >= PREFETCH_MAX_PENDING or self._memory_pressure():
+            metrics.inc('source_prefetch_total', {'result': 'skipped'})
+            return
+
+        with self._lock:
+            if file_unique_id in self._prefetches:
+                return
+            cancelled = threading.Event()
+            future = self.prefetch_pool.submit(self._prefetch, bot, photo, cancelled)
+            self._prefetches[file_unique_id] = (future, cancelled)
+        future.add_done_callback(lambda f: self._prefetch_done(file_unique_id, f))
+
+    def _prefetch(self, bot, photo, cancelled):
+        if cancelled.is_set():
+            return 'cancelled'
+        data = self.fetch(bot, photo)
+        # Keeping the download is cheap, but skip the decode if it's no longer wanted
+        if self.decoded is None:
+            return 'done'
+        if cancelled.is_set() or self._memory_pressure():
+            return 'cancelled'
+        self.decoded.get_or_create(photo.file_unique_id, lambda: self._decode(data))
+        return 'done'
+
+    def _prefetch_done(self, file_unique_id, future):
+        with self._lock:
+            entry = self._prefetches.get(file_unique_id)
+            if entry and entry[0] is future:
+                del self._prefetches[file_unique_id]
+        if future.cancelled():
+            result = 'cancelled'
+        elif future.exception():
+            print(f"Prefetch of {file_unique_id} failed: {future.exception()}")
+            result = 'failed'
+        else:
+            result = future.result()
+        metrics.inc('source_prefetch_total', {'result': result})
+
+    def cancel(self, file_unique_id):
+        """Stop a pending prefetch, or keep a running one from decoding"""
+        with self._lock:
+            entry = self._prefetches.pop(file_unique_id, None)
+        if entry:
+            future, cancelled = entry
+            cancelled.set()
+            future.cancel()
+
+    def get_image(self, bot, photo):
+        """Return a Telegram photo decoded to RGB. Callers must not modify it in place."""
+        # Let a running prefetch finish rather than downloading the photo twice
+        entry = self._prefetches.get(photo.file_unique_id)
+        if entry:
+            wait([entry[0]])
+        if self.decoded is None:
+            return self._decode(self.fetch(bot, photo))
+        return self.decoded.get_or_create(photo.file_unique_id, lambda: self._decode(self.fetch(bot, photo)))
+
+    @staticmethod
+    def _decode(data):
+        img = open_image(data)
+        # Decode now so the shared image is never lazily loaded from two threads
+        img.load()
+        return img
\ No newline at end of file
@@ -0,0 +1,90 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from cache import LRUCache
+from metrics import metrics
+
+# Opt-in: render every offered template while the keyboard is on screen
+SPECULATIVE_RENDERING = os.environ.get("SPECULATIVE_RENDERING", "0") == "1"
+SPECULATIVE_WORKERS = int(os.environ.get("SPECULATIVE_WORKERS", 2))
+# Skip speculation while system CPU use is above this percentage
+SPECULATIVE_MAX_CPU_PERCENT = float(os.environ.get("SPECULATIVE_MAX_CPU_PERCENT", 60))
+# Users whose unclaimed renders are kept, and for how long
+SPECULATIVE_MAX_USERS = int(os.environ.get("SPECULATIVE_MAX_USERS", 16))
+SPECULATIVE_TTL = int(os.environ.get("SPECULATIVE_TTL", 300))
+
+metrics.describe('speculative_renders_total', "Speculative template renders, by outcome")
+
+
+class SpeculativeRenderer:
+    """Renders every choice offered to a user ahead of their tap.
+
+    start(owner, {key: render}) queues one render per variant; claim(owner, key)
+    hands back the encoded result for the chosen key and drops the rest.
+    busy() reports when real render work is waiting, so speculation never
+    competes with it.
+    """
+
+    def __init__(self, encode, busy=None, enabled=SPECULATIVE_RENDERING, workers=SPECULATIVE_WORKERS):
+        self.encode = encode
+        self.busy = busy or (lambda: False)
+        self.enabled = enabled and workers > 0
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='speculative') if self.enabled else None
+        self.groups = LRUCache(SPECULATIVE_MAX_USERS, SPECULATIVE_TTL, on_evict=lambda owner, group: self._drop(group))
+        if self.enabled:
+            import psutil
+            # The first non-blocking reading is always 0.0; this sets the baseline for over_budget
+            psutil.cpu_percent(interval=None)
+
+    def over_budget(self):
+        import psutil
+        return self.busy() or psutil.cpu_percent(interval=None) > SPECULATIVE_MAX_CPU_PERCENT
+
+    def start(self, owner, renders):
+        """Render each {key: render()} for owner in the background, replacing any earlier set"""
+        if not self.enabled:
+            return
+        self._drop(self.groups.pop(owner) or {})
+        if self.over_budget():
+            metrics.inc('speculative_renders_total', {'result': 'skipped'}, len(renders))
+            return
+        group = {key: self.pool.submit(self._render, render) for key, render in renders.items()}
+        self.groups.set(owner, group)
+
+    def _render(self, render):
+        # Budget is checked again as each render starts, the queue may have filled up since
+        if self.over_budget():
+            metrics.inc('speculative_renders_total', {'result': 'skipped'})
+            return None
+        buffer = self.encode(render())
+        metrics.inc('speculative_renders_total', {'result': 'rendered'})
+        return buffer
+
+    def claim(self, owner, key):
+        """Return the encoded render for the chosen key, or None to render it normally"""
+        if not self.enabled:
+            return None
+        group = self.groups.pop(owner)
+        if not group:
+            return None
+        future = group.pop(key, None)
+        self._drop(group)
+
+        # Not started yet: rendering it directly is no slower than waiting
+        if future is None or future.cancel():
+            metrics.inc('speculative_renders_total', {'result': 'miss'})
+            return None
+        try:
+            buffer = future.result()
+        except Exception as e:
+            print(f"Speculative render failed: {e}")
+            buffer = None
+        metrics.inc('speculative_renders_total', {'result': 'hit' if buffer else 'miss'})
+        return buffer
+
+    def _drop(self, group):
+        """Cancel renders that haven't started, counting finished or running ones as wasted"""
+        for future in group.values():
+            if future.cancel():
+                continue
+            if not future.done() or future.exception() or future.result() is not None:
+                metrics.inc('speculative_renders_total', {'result': 'wasted'})
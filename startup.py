@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+from io import BytesIO
+from PIL import Image
+from image_processor import ImageProcessor
+from metrics import metrics
+
+# Photo sizes to render once in the background at startup, so the first real
+# render finds fonts, logo sizes and gradients cached. Telegram's largest photo
+# size is 1280px on the long side. Empty disables prewarming.
+PREWARM_SIZES = os.environ.get("PREWARM_SIZES", "853x1280,1280x720")
+# Seconds from process start until updates are being received; slower starts are logged as a warning
+STARTUP_BUDGET = float(os.environ.get("STARTUP_BUDGET", 5))
+
+# Legacy /itemp templates
+PREWARM_TEMPLATES = ('movie', 'series', 'minimal')
+
+
+def parse_sizes(value):
+    """'853x1280,1280x720' -> [(853, 1280), (1280, 720)]"""
+    sizes = []
+    for item in value.split(','):
+        if item.strip():
+            width, height = item.lower().split('x')
+            sizes.append((int(width), int(height)))
+    return sizes
+
+
+class StartupTimer:
+    """Records how long each startup phase took, measured from process start"""
+
+    def __init__(self, started_at):
+        self.started_at = started_at
+        self.phases = {}  # phase -> seconds since the previous mark
+        self.ready_at = None
+        self.first_update_at = None
+        self._last = started_at
+        metrics.gauge(
+            'startup_phase_seconds', lambda: dict(self.phases), "Time spent in each startup phase", label='phase'
+        )
+
+    def mark(self, phase):
+        now = time.monotonic()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def ready(self):
+        """Updates are now being received; log the report"""
+        self.ready_at = time.monotonic()
+        elapsed = self.ready_at - self.started_at
+        phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.phases.items())
+        print(f"Startup: ready in {elapsed:.2f}s ({phases})")
+        if elapsed > STARTUP_BUDGET:
+            print(f"Startup took {elapsed:.2f}s, over the {STARTUP_BUDGET:.0f}s budget")
+
+    def first_update(self, update, context):
+        """Dispatcher callback logging when the first update of this run arrives"""
+        if self.first_update_at is not None:
+            return
+        self.first_update_at = time.monotonic()
+        print(f"First update {self.first_update_at - self.started_at:.2f}s after start")
+
+
+def prewarm(template_manager, sizes=None):
+    """Render every template once per size in a background thread.
+
+    The render caches are process-wide, so this fills them for the real
+    renders. Nothing is sent or timed in the render metrics.
+    """
+    sizes = parse_sizes(PREWARM_SIZES) if sizes is None else sizes
+    if not sizes:
+        return None
+
+    def run():
+        started = time.monotonic()
+        processor = ImageProcessor()
+        try:
+            for size in sizes:
+                # Round-trip through JPEG so the codec plugins are loaded too
+                source = BytesIO()
+                Image.new('RGB', size, (40, 40, 40)).save(source, 'JPEG')
+                data = source.getvalue()
+                for template in PREWARM_TEMPLATES:
+                    processor.apply_template(data, template)
+                for key, template in template_manager.items():
+                    fields = {field: key for field in template.fields}
+                    template_manager.apply_template(data, key, fields)
+        except Exception as e:
+            print(f"Prewarm failed: {e}")
+            return
+        print(f"Prewarmed {len(sizes)} sizes in {time.monotonic() - started:.2f}s")
+
+    thread = threading.Thread(target=run, name="prewarm", daemon=True)
+    thread.start()
+    return thread
@@ -1,65 +0,0 @@
-TEMPLATES = {
-    "template1": {
-        "title_text": "🎬 {title}",
-        "genres_text": "🎭 {genres}",
-        "quality_text": "✨ {quality}",
-        "description": [
-            "🌟 CinemazBD - Your Ultimate Entertainment Hub",
-            "🎯 Best Quality, Fastest Downloads, No Ads!"
-        ],
-        "colors": {
-            "title": (255, 255, 255),
-            "genres": (200, 200, 200),
-            "quality": (255, 140, 0),
-            "description": (255, 255, 255)
-        },
-        "icons": {
-            "title": "🎬",
-            "genres": "🎭",
-            "quality": "✨",
-            "download": "⚡"
-        }
-    },
-    "template2": {
-        "title_text": "🎥 {title}",
-        "genres_text": "🎪 {genres}",
-        "quality_text": "💫 {quality}",
-        "description": [
-            "✨ CinemazBD - বাংলাদেশের সেরা মুভি হাব",
-            "🚀 Premium Quality, Instant Download"
-        ],
-        "colors": {
-            "title": (255, 255, 255),
-            "genres": (200, 200, 200),
-            "quality": (255, 165, 0),
-            "description": (255, 255, 255)
-        },
-        "icons": {
-            "title": "🎥",
-            "genres": "🎪",
-            "quality": "💫",
-            "download": "📥"
-        }
-    },
-    "template3": {
-        "title_text": "📽️ {title}",
-        "genres_text": "🎨 {genres}",
-        "quality_text": "🌟 {quality}",
-        "description": [
-            "💫 CinemazBD - Where Quality Meets Speed",
-            "🎯 আপনার প্রিয় সব কনটেন্ট এক জায়গায়"
-        ],
-        "colors": {
-            "title": (255, 255, 255),
-            "genres": (200, 200, 200),
-            "quality": (255, 140, 0),
-            "description": (255, 255, 255)
-        },
-        "icons": {
-            "title": "📽️",
-            "genres": "🎨",
-            "quality": "🌟",
-            "download": "⬇️"
-        }
-    }
-} 
\ No newline at end of file
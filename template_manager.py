@@ -1,17 +1,257 @@
+import hashlib
 import json
+import os
+import re
+import threading
+from string import Formatter
+from PIL import Image, ImageDraw
+from assets import assets, FONT_PATH
+from cache import LRUCache
+from gradients import GRADIENTS, apply_gradient
+from image_processor import open_image, stage_timer
+from metrics import metrics
+from text_effects import build_sprite, composite_sprite, draw_text_effect, offsets
+
+TEMPLATES_FILE = os.environ.get("TEMPLATES_FILE", "templates.json")
+# Layout plans per (template, image size); each holds only fonts and offsets
+TEMPLATE_PLAN_CACHE_SIZE = int(os.environ.get("TEMPLATE_PLAN_CACHE_SIZE", 32))
+# Byte budget for pre-rendered static text, shared by all templates and widths
+TEMPLATE_STATIC_CACHE_BYTES = int(os.environ.get("TEMPLATE_STATIC_CACHE_BYTES", 32 * 1024 * 1024))
+
+# Template keys end up in callback_data as template_<key>_<user id>
+KEY_PATTERN = re.compile(r'^[A-Za-z0-9-]+$')
+ALIGNMENTS = ('center', 'left', 'right')
+
+# textlength only needs a font, so one shared RGBA draw measures everything
+_measure = ImageDraw.Draw(Image.new('RGBA', (1, 1)))
+
+# (template key, version, width, font version) -> [(layer index, sprite, offset)]
+_static_layers = LRUCache(
+    maxsize=256,
+    max_weight=TEMPLATE_STATIC_CACHE_BYTES,
+    weigher=lambda sprites: sum(sprite.width * sprite.height * 4 for _, sprite, _ in sprites),
+)
+metrics.register_cache('template_static', _static_layers)
+
+
+def _color(value, where):
+    if not isinstance(value, (list, tuple)) or len(value) not in (3, 4):
+        raise ValueError(f"{where}: colors are [r, g, b] or [r, g, b, a]")
+    return tuple(int(channel) for channel in value)
+
+
+class Layer:
+    """One block of text lines, drawn with the same font size, color and effect"""
+
+    def __init__(self, spec, where):
+        if not isinstance(spec, dict):
+            raise ValueError(f"{where}: must be an object")
+        self.name = spec.get('name')
+        if self.name:
+            where = f"{where} ({self.name})"
+        if 'lines' in spec:
+            self.lines = list(spec['lines'])
+        elif 'text' in spec:
+            self.lines = [spec['text']]
+        else:
+            raise ValueError(f"{where}: needs 'text' or 'lines'")
+
+        self.size = float(spec['size'])
+        if not 0 < self.size < 1:
+            raise ValueError(f"{where}: size is a fraction of the image width")
+        self.color = _color(spec.get('color', [255, 255, 255]), where)
+        self.top = spec.get('top')
+        self.gap = int(spec.get('gap', 0))
+        self.line_gap = int(spec.get('line_gap', 0))
+        self.align = spec.get('align', 'center')
+        if self.align not in ALIGNMENTS:
+            raise ValueError(f"{where}: align must be one of {', '.join(ALIGNMENTS)}")
+        self.margin = float(spec.get('margin', 0))
+
+        shadow = spec.get('shadow')
+        if shadow:
+            self.effect = (
+                (offsets(int(shadow.get('radius', 2))), _color(shadow.get('color', [0, 0, 0, 100]), where)),
+                (((0, 0),), self.color),
+            )
+        else:
+            self.effect = None
+        # Static lines are pre-rendered as sprites, which always go through the effect path
+        self.sprite_layers = self.effect or ((((0, 0),), self.color),)
+
+        self.fields = {field for line in self.lines for _, field, _, _ in Formatter().parse(line) if field}
+        self.dynamic = bool(self.fields)
+
+
+class Placement:
+    """A layer resolved for one image size: its font, line tops and any static x offsets"""
+
+    def __init__(self, layer, font, font_size, ys, xs):
+        self.layer = layer
+        self.font = font
+        self.font_size = font_size
+        self.ys = ys
+        self.xs = xs  # None for layers whose text depends on the render's fields
+
+
+class Template:
+    """A compiled template definition"""
+
+    def __init__(self, key, spec, font_path=FONT_PATH):
+        where = f"Template {key}"
+        if not KEY_PATTERN.match(key):
+            raise ValueError(f"{where}: keys may only use letters, digits and '-'")
+        if not isinstance(spec, dict):
+            raise ValueError(f"{where}: must be an object")
+        self.key = key
+        self.label = spec.get('label', key)
+        self.gradient = spec.get('gradient')
+        if self.gradient is not None and self.gradient not in GRADIENTS:
+            raise ValueError(f"{where}: unknown gradient {self.gradient}")
+        self.download_icon = spec.get('download_icon', '⬇️')
+        self.font_path = spec.get('font', font_path)
+        self.layers = [Layer(layer, f"{where} layer {i}") for i, layer in enumerate(spec.get('layers', []))]
+        if not self.layers or self.layers[0].top is None:
+            raise ValueError(f"{where}: the first layer needs a 'top'")
+        self.fields = set().union(*(layer.fields for layer in self.layers))
+        # Changes whenever the definition does, so cached renders of it can be told apart
+        self.version = hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:12]
+        self._plans = LRUCache(TEMPLATE_PLAN_CACHE_SIZE)
+
+    def _x(self, layer, width, text, font):
+        if layer.align == 'left':
+            return int(width * layer.margin)
+        text_width = _measure.textlength(text, font=font)
+        if layer.align == 'right':
+            return int(width * (1 - layer.margin) - text_width)
+        return int((width - text_width) / 2)
+
+    def _build_plan(self, width, height):
+        plan = []
+        bottom = 0
+        for layer in self.layers:
+            font_size = int(width * layer.size)
+            font = assets.get_font(font_size, self.font_path)
+            top = int(height * layer.top) if layer.top is not None else bottom + layer.gap
+            ys = [top + i * (font_size + layer.line_gap) for i in range(len(layer.lines))]
+            xs = None if layer.dynamic else [self._x(layer, width, line, font) for line in layer.lines]
+            plan.append(Placement(layer, font, font_size, ys, xs))
+            bottom = ys[-1] + font_size
+        return plan
+
+    def plan(self, width, height):
+        """Layout for an image size: fonts resolved and everything but dynamic text measured"""
+        key = (width, height, assets.version(self.font_path))
+        return self._plans.get_or_create(key, lambda: self._build_plan(width, height))
+
+    def _build_static(self, plan):
+        sprites = []
+        for index, placement in enumerate(plan):
+            layer = placement.layer
+            if layer.dynamic:
+                continue
+            # Lines are positioned relative to the layer's first line, so one sprite fits any height
+            top = placement.ys[0]
+            lines = [(line, (x, y - top)) for line, x, y in zip(layer.lines, placement.xs, placement.ys)]
+            sprite, offset = build_sprite(lines, placement.font, layer.sprite_layers)
+            sprites.append((index, sprite, offset))
+        return sprites
+
+    def static_layers(self, width, height):
+        """Pre-rendered static text for an image width as [(layer index, sprite, offset)]"""
+        plan = self.plan(width, height)
+        key = (self.key, self.version, width, assets.version(self.font_path))
+        return _static_layers.get_or_create(key, lambda: self._build_static(plan))
+
+    def draw_text(self, img, fields):
+        """Draw every layer onto an RGBA image, filling {field}s from fields"""
+        static = {index: (sprite, offset) for index, sprite, offset in self.static_layers(img.width, img.height)}
+        draw = ImageDraw.Draw(img)
+        for index, placement in enumerate(self.plan(img.width, img.height)):
+            layer = placement.layer
+            if index in static:
+                # One composite for all of the layer's pre-rendered lines
+                sprite, (x, y) = static[index]
+                composite_sprite(img, sprite, (x, placement.ys[0] + y))
+                continue
+            for line, y in zip(layer.lines, placement.ys):
+                line = line.format_map(fields)
+                position = (self._x(layer, img.width, line, placement.font), y)
+                if layer.effect:
+                    # Filled in from the user's fields, so unlikely to be drawn again
+                    draw_text_effect(img, position, line, placement.font, layer.effect, cache=False)
+                else:
+                    draw.text(position, line, font=placement.font, fill=layer.color)
+        return img
+
 
 class TemplateManager:
-    def __init__(self):
-        self.templates = self.load_templates()
-    
+    """Loads and compiles templates from a JSON file, reloading it when it changes on disk"""
+
+    def __init__(self, path=TEMPLATES_FILE):
+        self.path = path
+        self.templates = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+        self.load_templates()
+
     def load_templates(self):
-        with open('templates.json', 'r') as f:
-            return json.load(f)
-    
-    def apply_template(self, image, template_name):
-        if template_name in self.templates:
-            template = self.templates[template_name]
-            # Apply template settings
-            # (position, size, effects etc.)
-            return processed_image
-        return image 
\ No newline at end of file
+        """Compile the file if it changed; a broken edit or a missing file keeps the last good templates"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            # Remembered like an mtime, so a missing file is reported once rather than on every call
+            mtime = -1
+        if mtime == self._mtime:
+            return self.templates
+        with self._lock:
+            if mtime == self._mtime:
+                return self.templates
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    specs = json.load(f)
+                if not isinstance(specs, dict):
+                    raise ValueError("templates must be a JSON object keyed by template number")
+                templates = {key: Template(key, spec) for key, spec in specs.items()}
+            except Exception as e:
+                if not self.templates:
+                    raise
+                print(f"Keeping previous templates, {self.path} is invalid: {e}")
+                templates = self.templates
+            else:
+                print(f"Loaded {len(templates)} templates from {self.path}")
+            self.templates = templates
+            self._mtime = mtime
+        return self.templates
+
+    def get(self, name):
+        templates = self.load_templates()
+        if name not in templates:
+            raise ValueError(f"Unknown template: {name}")
+        return templates[name]
+
+    def items(self):
+        return list(self.load_templates().items())
+
+    def apply_template(self, image, template_name, fields, on_stage=None):
+        """Render a template over an image source with the given field values, returning RGB"""
+        template = self.get(template_name)
+        missing = template.fields - set(fields)
+        if missing:
+            raise ValueError(f"Missing template fields: {', '.join(sorted(missing))}")
+
+        with stage_timer(on_stage, 'decode'):
+            img = open_image(image)
+            img.load()
+
+        with stage_timer(on_stage, 'gradient'):
+            if template.gradient:
+                img = apply_gradient(img, template.gradient)
+            else:
+                img = img.convert('RGBA')
+
+        with stage_timer(on_stage, 'text'):
+            template.draw_text(img, fields)
+
+        with stage_timer(on_stage, 'convert'):
+            return img.convert('RGB')
@@ -0,0 +1,85 @@
+from PIL import Image, ImageDraw
+import os
+from cache import LRUCache
+from metrics import metrics
+
+TEXT_SPRITE_CACHE_SIZE = int(os.environ.get("TEXT_SPRITE_CACHE_SIZE", 64))
+# Sprites are RGBA, four bytes per pixel
+TEXT_SPRITE_CACHE_BYTES = int(os.environ.get("TEXT_SPRITE_CACHE_BYTES", 16 * 1024 * 1024))
+
+_sprites = LRUCache(
+    TEXT_SPRITE_CACHE_SIZE,
+    max_weight=TEXT_SPRITE_CACHE_BYTES,
+    weigher=lambda entry: entry[0].width * entry[0].height * 4,
+)
+metrics.register_cache('text_sprites', _sprites)
+
+
+def offsets(radius, step=1):
+    """Square grid of (x, y) offsets used to smear text into a shadow or glow"""
+    steps = range(-radius, radius + 1, step)
+    return tuple((x, y) for x in steps for y in steps)
+
+
+def build_sprite(lines, font, layers):
+    """Rasterize (text, (x, y)) lines with one font and the same effect layers.
+
+    Returns (sprite, offset); the sprite's top-left corner goes at offset,
+    relative to the same origin as the line positions.
+    """
+    pad = max(max(abs(x), abs(y)) for layer_offsets, _ in layers for x, y in layer_offsets)
+    glyphs = []
+    for text, (x, y) in lines:
+        left, top, right, bottom = font.getbbox(text)
+        # Rasterize each line once and reuse the mask for every pass
+        glyph = Image.new('L', (max(right - left, 1), max(bottom - top, 1)), 0)
+        ImageDraw.Draw(glyph).text((-left, -top), text, font=font, fill=255)
+        glyphs.append((glyph, x + left, y + top))
+
+    left = min(x for _, x, _ in glyphs) - pad
+    top = min(y for _, _, y in glyphs) - pad
+    right = max(x + glyph.width for glyph, x, _ in glyphs) + pad
+    bottom = max(y + glyph.height for glyph, _, y in glyphs) + pad
+
+    # Accumulate the passes the same way repeated draw.text calls would:
+    # premultiplied colour plus combined coverage
+    size = (right - left, bottom - top)
+    color = Image.new('RGB', size, (0, 0, 0))
+    coverage = Image.new('L', size, 0)
+    for glyph, x, y in glyphs:
+        for layer_offsets, fill in layers:
+            for dx, dy in layer_offsets:
+                box = (x - left + dx, y - top + dy)
+                color.paste(tuple(fill[:3]), box, glyph)
+                coverage.paste(255, box, glyph)
+
+    sprite = Image.merge('RGBa', (*color.split(), coverage)).convert('RGBA')
+    return sprite, (left, top)
+
+
+def get_text_sprite(text, font, layers, cache=True):
+    """Return (sprite, offset) for text rendered with the given effect layers.
+
+    layers is a sequence of (offsets, fill) pairs drawn in order, e.g. a
+    shadow, then a glow, then ((0, 0),) for the fill itself. The sprite's
+    top-left corner goes at the text position plus offset. Pass cache=False
+    for one-off text, such as user-supplied titles.
+    """
+    layers = tuple((tuple(layer_offsets), tuple(fill)) for layer_offsets, fill in layers)
+    if not cache:
+        return build_sprite([(text, (0, 0))], font, layers)
+    return _sprites.get_or_create((text, font, layers), lambda: build_sprite([(text, (0, 0))], font, layers))
+
+
+def draw_text_effect(img, position, text, font, layers, cache=True):
+    """Composite effect text onto an RGBA image in place"""
+    sprite, (dx, dy) = get_text_sprite(text, font, layers, cache)
+    composite_sprite(img, sprite, (position[0] + dx, position[1] + dy))
+
+
+def composite_sprite(img, sprite, position):
+    """alpha_composite a sprite onto img in place, clipping it at the top/left edge"""
+    x, y = position
+    # alpha_composite rejects negative destinations
+    source = (max(-x, 0), max(-y, 0))
+    img.alpha_composite(sprite, (max(x, 0), max(y, 0)), source)
\ No newline at end of file
@@ -0,0 +1,117 @@
+"""TMDB client check.
+
+Starts a fake TMDB API on localhost and checks TmdbClient against it:
+concurrent identical lookups reach upstream once, expired entries are
+fetched again, the JSON cache file is reloaded after a restart, and a
+request that times out is retried TMDB_RETRIES times before failing.
+
+    python tmdb_check.py
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import requests
+
+import tmdb_client
+from tmdb_client import TmdbClient, TMDB_RETRIES
+
+# The fake server holds every response this long, so concurrent lookups overlap
+RESPONSE_DELAY = 0.2
+# Requests for this movie id never answer within the check's read timeout
+SLOW_MOVIE = 999
+READ_TIMEOUT = 0.3
+
+
+class FakeTmdb(BaseHTTPRequestHandler):
+    hits = {}  # path -> requests received
+    lock = threading.Lock()
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        with self.lock:
+            self.hits[path] = self.hits.get(path, 0) + 1
+        time.sleep(READ_TIMEOUT * 3 if path == f'/movie/{SLOW_MOVIE}' else RESPONSE_DELAY)
+        body = json.dumps({'id': path.rsplit('/', 1)[-1], 'results': []}).encode()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass  # The client gave up waiting
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTmdb)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    failures = []
+
+    def check(name, ok, detail):
+        print(f"{'ok  ' if ok else 'FAIL'} {name}: {detail}")
+        if not ok:
+            failures.append(name)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache_file = os.path.join(directory, 'tmdb.json')
+        client = TmdbClient('check', base_url=base_url, cache_file=cache_file)
+
+        # Single flight: 20 identical lookups at once, one upstream request
+        with ThreadPoolExecutor(20) as pool:
+            results = list(pool.map(lambda _: client.movie_details(1), range(20)))
+        hits = FakeTmdb.hits.get('/movie/1', 0)
+        check("single flight", hits == 1 and all(r == results[0] for r in results),
+              f"20 concurrent lookups, {hits} upstream")
+
+        # TTL: an entry past its expiry is fetched again
+        tmdb_client.TMDB_DETAILS_TTL = 0.5
+        client.movie_details(2)
+        client.movie_details(2)
+        cached_hits = FakeTmdb.hits.get('/movie/2', 0)
+        time.sleep(0.6)
+        client.movie_details(2)
+        hits = FakeTmdb.hits.get('/movie/2', 0)
+        check("ttl refetch", cached_hits == 1 and hits == 2,
+              f"{cached_hits} upstream before expiry, {hits} after")
+        tmdb_client.TMDB_DETAILS_TTL = 3600
+
+        # Persistence: a new client reloads the saved cache instead of asking upstream
+        client.movie_details(3)
+        client.save_cache()
+        restarted = TmdbClient('check', base_url=base_url, cache_file=cache_file)
+        restarted.movie_details(3)
+        hits = FakeTmdb.hits.get('/movie/3', 0)
+        check("persistence", restarted.upstream_calls == 0 and hits == 1,
+              f"{len(restarted.cache)} entries reloaded, {restarted.upstream_calls} upstream after restart")
+
+        # Timeouts: bounded retries, then a requests exception rather than a hang
+        restarted.timeout = (1, READ_TIMEOUT)
+        started = time.monotonic()
+        try:
+            restarted.movie_details(SLOW_MOVIE)
+            error = None
+        except requests.RequestException as e:
+            error = e
+        elapsed = time.monotonic() - started
+        hits = FakeTmdb.hits.get(f'/movie/{SLOW_MOVIE}', 0)
+        check("timeout retries", error is not None and hits == 1 + TMDB_RETRIES,
+              f"{hits} attempts in {elapsed:.1f}s, then {type(error).__name__}")
+
+    server.shutdown()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cache import LRUCache
+from metrics import metrics
+
+TMDB_API_URL = os.environ.get("TMDB_API_URL", "https://api.themoviedb.org/3")
+TMDB_CONNECT_TIMEOUT = float(os.environ.get("TMDB_CONNECT_TIMEOUT", 3.05))
+TMDB_READ_TIMEOUT = float(os.environ.get("TMDB_READ_TIMEOUT", 10))
+TMDB_RETRIES = int(os.environ.get("TMDB_RETRIES", 3))
+TMDB_POOL_SIZE = int(os.environ.get("TMDB_POOL_SIZE", 10))
+TMDB_CACHE_SIZE = int(os.environ.get("TMDB_CACHE_SIZE", 500))
+TMDB_SEARCH_TTL = int(os.environ.get("TMDB_SEARCH_TTL", 6 * 3600))
+TMDB_DETAILS_TTL = int(os.environ.get("TMDB_DETAILS_TTL", 24 * 3600))
+# Optional JSON file the cache is persisted to, so it survives restarts
+TMDB_CACHE_FILE = os.environ.get("TMDB_CACHE_FILE")
+TMDB_CACHE_SAVE_INTERVAL = int(os.environ.get("TMDB_CACHE_SAVE_INTERVAL", 60))
+
+
+class _Call:
+    """An in-flight upstream request that identical lookups wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class TmdbClient:
+    """TMDB API client with a pooled session, a TTL cache and single-flight lookups"""
+
+    def __init__(self, api_key, base_url=TMDB_API_URL, cache_file=TMDB_CACHE_FILE):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (TMDB_CONNECT_TIMEOUT, TMDB_READ_TIMEOUT)
+        self.cache = LRUCache(TMDB_CACHE_SIZE)
+        metrics.register_cache('tmdb', self.cache)
+        self.cache_file = cache_file
+        self.upstream_calls = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+
+        retry = Retry(
+            total=TMDB_RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=['GET'],
+        )
+        adapter = HTTPAdapter(pool_connections=TMDB_POOL_SIZE, pool_maxsize=TMDB_POOL_SIZE, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        if self.cache_file:
+            self._load_cache()
+            threading.Thread(target=self._save_loop, daemon=True).start()
+
+    def search_movie(self, query, page=1):
+        return self._get('/search/movie', {'query': query, 'page': page}, TMDB_SEARCH_TTL)
+
+    def search_tv(self, query, page=1):
+        return self._get('/search/tv', {'query': query, 'page': page}, TMDB_SEARCH_TTL)
+
+    def movie_details(self, movie_id):
+        return self._get(f'/movie/{movie_id}', {}, TMDB_DETAILS_TTL)
+
+    def tv_details(self, tv_id):
+        return self._get(f'/tv/{tv_id}', {}, TMDB_DETAILS_TTL)
+
+    def _get(self, path, params, ttl):
+        params = dict(params, language='en-US')
+        # Searches are case-insensitive upstream, so share cache entries across casing
+        if 'query' in params:
+            params['query'] = ' '.join(str(params['query']).lower().split())
+        key = path + '?' + '&'.join(f"{k}={params[k]}" for k in sorted(params))
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        # Coalesce concurrent identical lookups into one upstream call
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._fetch(path, params)
+            self.cache.set(key, call.result, expires_at=time.time() + ttl)
+            self._dirty = True
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+
+    def _fetch(self, path, params):
+        self.upstream_calls += 1
+        # Label by endpoint, not by the id inside the path
+        endpoint = '/'.join(part for part in path.split('/') if part and not part.isdigit())
+        with metrics.timer('tmdb_request_seconds', {'endpoint': endpoint}):
+            response = self.session.get(
+                self.base_url + path,
+                params=dict(params, api_key=self.api_key),
+                timeout=self.timeout,
+            )
+        response.raise_for_status()
+        return response.json()
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_file, 'r') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"Could not load TMDB cache: {e}")
+            return
+
+        now = time.time()
+        for key, value, expires_at in entries:
+            if expires_at > now:
+                self.cache.set(key, value, expires_at=expires_at)
+
+    def _save_loop(self):
+        while True:
+            time.sleep(TMDB_CACHE_SAVE_INTERVAL)
+            try:
+                self.save_cache()
+            except Exception as e:
+                print(f"Could not save TMDB cache: {e}")
+
+    def save_cache(self):
+        """Write the cache to cache_file if anything changed since the last save"""
+        if not self.cache_file or not self._dirty:
+            return
+        self._dirty = False
+        temp_path = self.cache_file + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.cache.items(), f)
+        os.replace(temp_path, self.cache_file)
\ No newline at end of file
@@ -0,0 +1,55 @@
+import hashlib
+import json
+import os
+from telegram import Update
+from metrics import metrics
+
+# "polling" (default) or "webhook"
+BOT_MODE = os.environ.get("BOT_MODE", "polling").lower()
+# Public HTTPS base URL Telegram should deliver to, e.g. https://poster.example.com
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")
+# Secret part of the webhook path; derived from the bot token when unset
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", 40))
+
+metrics.describe('webhook_updates_total', "Updates received over the webhook, by result")
+
+
+def webhook_path(token, secret=WEBHOOK_SECRET):
+    """Path the webhook is served on.
+
+    Only Telegram knows it, so it doubles as the shared secret.
+    """
+    secret = secret or hashlib.sha256(token.encode()).hexdigest()[:32]
+    return f"/webhook/{secret}"
+
+
+class WebhookReceiver:
+    """HealthServer route that decodes posted updates onto the dispatcher queue.
+
+    The HTTP server handles each request on its own thread and only enqueues,
+    so Telegram gets its 200 back straight away while the dispatcher (and its
+    run_async workers) process updates in the background.
+    """
+
+    def __init__(self, bot, update_queue):
+        self.bot = bot
+        self.update_queue = update_queue
+
+    def __call__(self, body):
+        try:
+            update = Update.de_json(json.loads(body), self.bot)
+        except Exception as e:
+            print(f"Rejected webhook update: {e}")
+            metrics.inc('webhook_updates_total', {'result': 'rejected'})
+            return 400, 'text/plain', b"Bad update"
+        if update is None:
+            metrics.inc('webhook_updates_total', {'result': 'rejected'})
+            return 400, 'text/plain', b"Bad update"
+
+        self.update_queue.put(update)
+        metrics.inc('webhook_updates_total', {'result': 'accepted'})
+        return 200, 'text/plain', b"OK"
+
+    def register(self, server, path):
+        server.add_route('POST', path, self)
@@ -0,0 +1,144 @@
+"""Webhook load check.
+
+Posts synthetic Telegram updates to a webhook listener and reports accepted
+requests, dispatched updates and throughput. Without --url it starts a local
+listener (HealthServer + WebhookReceiver + a dispatcher with a counting
+handler), so the webhook path can be checked without Telegram.
+
+    python webhook_check.py --updates 2000 --concurrency 16
+    python webhook_check.py --url http://localhost:8080/webhook/<secret>
+"""
+import argparse
+import json
+import socket
+import statistics
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+
+from telegram import Bot, User
+from telegram.ext import Dispatcher, MessageHandler, Filters
+
+from server import HealthServer
+from webhook import WebhookReceiver, webhook_path
+
+CHECK_TOKEN = "123456:webhook-check"
+
+
+def synthetic_update(update_id, chat_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Check'},
+            'text': f"/start {update_id}",
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+        },
+    }
+
+
+class LocalListener:
+    """A webhook listener wired like PosterBot, with a handler that only counts updates"""
+
+    def __init__(self, workers):
+        self.bot = Bot(CHECK_TOKEN)
+        # Dispatcher.start names its threads after bot.id; skip the getMe call
+        self.bot._bot = User(id=123456, first_name='Check', is_bot=True, username='webhook_check_bot')
+        self.dispatcher = Dispatcher(self.bot, Queue(), workers=workers)
+        self.seen = set()
+        self.done = threading.Event()
+        self.expected = 0
+        self._lock = threading.Lock()
+        self.dispatcher.add_handler(MessageHandler(Filters.all, self.count, run_async=True))
+
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        self.server = HealthServer(port=port, host='127.0.0.1')
+        path = webhook_path(CHECK_TOKEN)
+        WebhookReceiver(self.bot, self.dispatcher.update_queue).register(self.server, path)
+        self.address = ('127.0.0.1', port)
+        self.url = f"http://127.0.0.1:{port}{path}"
+
+    def count(self, update, context):
+        with self._lock:
+            self.seen.add(update.update_id)
+            if len(self.seen) >= self.expected:
+                self.done.set()
+
+    def start(self, expected):
+        self.expected = expected
+        self.server.start()
+        threading.Thread(target=self.dispatcher.start, daemon=True).start()
+        # Wait for the listener socket to come up
+        for _ in range(100):
+            try:
+                socket.create_connection(self.address, timeout=0.1).close()
+                return
+            except OSError:
+                time.sleep(0.05)
+
+
+def post(url, payload):
+    data = json.dumps(payload).encode()
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Post synthetic updates to a webhook listener")
+    parser.add_argument('--url', help="webhook URL of a running bot; starts a local listener when omitted")
+    parser.add_argument('--updates', type=int, default=1000, help="number of updates to post")
+    parser.add_argument('--concurrency', type=int, default=16, help="parallel HTTP clients")
+    parser.add_argument('--chats', type=int, default=50, help="distinct synthetic chats")
+    parser.add_argument('--workers', type=int, default=4, help="dispatcher workers for the local listener")
+    args = parser.parse_args(argv)
+
+    local = None
+    url = args.url
+    if not url:
+        local = LocalListener(args.workers)
+        local.start(args.updates)
+        url = local.url
+
+    payloads = [synthetic_update(i + 1, 1000 + i % args.chats) for i in range(args.updates)]
+    # One malformed body to check it is rejected rather than crashing the listener
+    bad_status, _ = post(url, {'not': 'an update'})
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda payload: post(url, payload), payloads))
+    posted = time.perf_counter() - started
+
+    statuses = [status for status, _ in results]
+    latencies = sorted(latency for _, latency in results)
+    accepted = statuses.count(200)
+    print(f"posted {len(results)} updates in {posted:.2f}s ({len(results) / posted:.0f} req/s), {accepted} accepted")
+    print(f"latency p50 {statistics.median(latencies) * 1000:.1f}ms  p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms")
+    print(f"malformed update -> HTTP {bad_status}")
+
+    ok = accepted == len(results) and bad_status == 400
+    if local:
+        local.done.wait(timeout=30)
+        dispatched = time.perf_counter() - started
+        missing = set(range(1, args.updates + 1)) - local.seen
+        print(f"dispatched {len(local.seen)} updates in {dispatched:.2f}s ({len(local.seen) / dispatched:.0f} updates/s), {len(missing)} missing")
+        local.dispatcher.stop()
+        ok = ok and not missing
+
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())